@@ -3,9 +3,25 @@
 """
 HealthAI dashboard
 """
+import os
 
 import dash
+import diskcache
 
+from pages import config
+from utils import metrics
+from utils.jobs import JobManager
 
-app = dash.Dash(__name__, suppress_callback_exceptions=True)
+
+# Tasks are sent from job processes, which report their progress and result
+# through a cache on disk shared by all worker processes
+jobs = diskcache.Cache(getattr(config, 'jobs_dir', None) or os.path.join(
+    getattr(config, 'cache_dir', os.path.join(os.getcwd(), 'cache')), 'jobs'
+))
+
+app = dash.Dash(
+    __name__, suppress_callback_exceptions=True, compress=True,
+    long_callback_manager=JobManager(jobs)
+)
 server = app.server
+metrics.register(app)
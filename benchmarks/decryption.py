@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the decryption and decoding of encrypted results
+
+Run from the repository root with: python -m benchmarks.decryption
+"""
+import os
+import json
+import argparse
+import time
+import tempfile
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from vantage6.client.deserialization import load_data
+from vantage6.common.encryption import RSACryptor
+
+from benchmarks.statistics import STAGES
+from utils.decoding import ResultDecoder
+
+
+# ------------------------------------------------------------------------------
+# Synthetic encrypted results
+# ------------------------------------------------------------------------------
+def encrypted_rows(cryptor, n_orgs, n_points, seed=0):
+    """ One encrypted statistics result per organisation
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_orgs):
+        result = {
+            'organisation': f'centre {i}',
+            'nids': int(rng.integers(50, 1000)),
+            'stage': {
+                'stage': STAGES,
+                'id': rng.integers(0, 100, len(STAGES)).tolist()
+            },
+            'survival': np.sort(rng.random(n_points))[::-1].tolist()
+        }
+        data = b'json.' + json.dumps(result).encode()
+        rows.append({
+            'id': i,
+            'result': cryptor.encrypt_bytes_to_str(data, cryptor.public_key_str)
+        })
+    return rows
+
+
+def decode_serial(cryptor, rows):
+    # What the vantage6 client does, one row after the other
+    return [
+        load_data(cryptor.decrypt_str_to_bytes(row['result'])) for row in rows
+    ]
+
+
+def decode_parallel(decoder, client, rows):
+    return list(decoder.decode(client, rows))
+
+
+# ------------------------------------------------------------------------------
+# Run benchmark
+# ------------------------------------------------------------------------------
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument(
+        '--workers', type=int, default=os.cpu_count(),
+        help='number of worker processes'
+    )
+    args = args.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = Path(directory)/'private.pem'
+    RSACryptor.create_new_rsa_key(path)
+    cryptor = RSACryptor(path)
+    client = SimpleNamespace(cryptor=cryptor)
+
+    decoder = ResultDecoder(path, args.workers)
+    decoder.min_bytes = 0
+    # Start the worker processes before measuring
+    decode_parallel(decoder, client, encrypted_rows(cryptor, 32, 10))
+
+    print(f'{os.cpu_count()} CPUs, {decoder.workers} worker processes\n')
+    print(f'{"orgs":>6} {"points":>8} {"MB":>7} {"serial (ms)":>12} '
+          f'{"parallel (ms)":>14} {"speed-up":>9}')
+    for n_orgs in [5, 20, 100]:
+        for n_points in [25, 10000, 50000]:
+            rows = encrypted_rows(cryptor, n_orgs, n_points)
+            size = sum(len(row['result']) for row in rows)/1e6
+            start = time.perf_counter()
+            decode_serial(cryptor, rows)
+            serial = time.perf_counter() - start
+            start = time.perf_counter()
+            decode_parallel(decoder, client, rows)
+            parallel = time.perf_counter() - start
+            print(f'{n_orgs:>6} {n_points:>8} {size:>7.2f} '
+                  f'{serial*1e3:>12.1f} {parallel*1e3:>14.1f} '
+                  f'{serial/parallel:>8.1f}x')
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the figure payloads of the statistics page
+
+Run from the repository root with: python -m benchmarks.figures
+"""
+import gzip
+import json
+import timeit
+
+import plotly
+import plotly.express as px
+
+from benchmarks.statistics import CUTOFF
+from benchmarks.statistics import DELTA
+from benchmarks.statistics import synthetic_results
+from utils.figures import compact
+from utils.results import parse_statistics
+
+
+# ------------------------------------------------------------------------------
+# Figures
+# ------------------------------------------------------------------------------
+def statistics_figures(results):
+    """ The four figures of the statistics page
+    """
+    dfg1, dfg2, dfg3, dfg4 = parse_statistics(results, CUTOFF, DELTA)
+    return [
+        px.bar(dfg1, x='centre', y='patients'),
+        px.bar(dfg2, x='centre', y='patients', color='stage'),
+        px.bar(dfg3, x='centre', y='patients', color='vital status'),
+        px.line(
+            dfg4, x='survival days', y='survival rate', range_y=[0, 1],
+            color='centre'
+        )
+    ]
+
+
+def serialize(payload):
+    # Same encoder as the callback responses of dash
+    return json.dumps(payload, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def measure(build):
+    payload = serialize(build())
+    seconds = min(timeit.repeat(
+        lambda: serialize(build()), number=5, repeat=3
+    ))/5
+    return len(payload), len(gzip.compress(payload.encode())), seconds
+
+
+# ------------------------------------------------------------------------------
+# Run benchmark
+# ------------------------------------------------------------------------------
+if __name__ == '__main__':
+    print(f'{"orgs":>6} {"figure":>8} {"bytes":>10} {"gzip":>9} '
+          f'{"build + dump (ms)":>18}')
+    for n_orgs in [5, 100]:
+        full = statistics_figures(synthetic_results(n_orgs))
+        # Typed arrays are measured even when the bundled plotly.js does not
+        # support them yet
+        variants = [
+            ('full', lambda: [figure.to_dict() for figure in full]),
+            ('lists', lambda: [
+                compact(figure, binary=False) for figure in full
+            ]),
+            ('binary', lambda: [
+                compact(figure, binary=True) for figure in full
+            ]),
+        ]
+        for name, build in variants:
+            size, zipped, seconds = measure(build)
+            print(f'{n_orgs:>6} {name:>8} {size:>10} {zipped:>9} '
+                  f'{seconds*1e3:>18.2f}')
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end load test of the dashboard against a mock vantage6 server
+
+Run from the repository root with: python -m benchmarks.load
+
+Every simulated user opens the pages, sends their task and polls its
+results like the browser does, through the Dash callback endpoints of the
+dashboard. The throughput and latency percentiles of every callback and the
+time until the results are shown are reported.
+"""
+import sys
+import time
+import uuid
+import logging
+import argparse
+import tempfile
+import threading
+
+from collections import defaultdict
+
+import numpy as np
+
+from benchmarks.mock_server import MockServer
+
+
+# Send button, task output, results outputs and poll interval of every page
+PAGES = {
+    'statistics': (
+        'send-stats-task', 'output-statistics-task',
+        ['output-statistics'], 'poll-results2'
+    ),
+    'similarity': (
+        'send-task', 'output-send-task',
+        ['output-similarity-results', 'similarity-lookup'], 'poll-results'
+    ),
+    'survival': (
+        'send-task3', 'output-send-task3',
+        ['output-survival-results', 'survival-lookup'], 'poll-results3'
+    ),
+}
+
+
+# ------------------------------------------------------------------------------
+# Dashboard
+# ------------------------------------------------------------------------------
+def configure(server, cache):
+    """ Point the dashboard to the mock server, before importing it
+    """
+    from pages import config
+
+    config.server_url = server.url
+    config.server_port = server.port
+    config.server_api = '/api'
+    config.privkey_path = None
+    config.cutoff = server.survival_points*config.delta
+    config.cache_dir = tempfile.mkdtemp(prefix='healthai-load-')
+    config.state_db = f'{config.cache_dir}/state.sqlite'
+    if not cache:
+        config.cache_ttl = 0
+
+
+def callback(client, outputs, inputs, state):
+    """ Call a Dash callback and return its latency and response
+    """
+    properties = [
+        {'id': id_, 'property': prop} for id_, prop in outputs
+    ]
+    payload = {
+        'output': f'{outputs[0][0]}.{outputs[0][1]}' if len(outputs) == 1
+        else '..' + '...'.join(f'{id_}.{prop}' for id_, prop in outputs)
+        + '..',
+        'outputs': properties[0] if len(outputs) == 1 else properties,
+        'inputs': [
+            {'id': id_, 'property': prop, 'value': value}
+            for id_, prop, value in inputs
+        ],
+        'changedPropIds': [f'{inputs[0][0]}.{inputs[0][1]}'],
+        'state': [
+            {'id': id_, 'property': prop, 'value': value}
+            for id_, prop, value in state
+        ]
+    }
+    start = time.perf_counter()
+    response = client.post('/_dash-update-component', json=payload)
+    latency = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(
+            f'{payload["output"]} failed with {response.status_code}'
+        )
+    return latency, response.get_json()
+
+
+# ------------------------------------------------------------------------------
+# Users
+# ------------------------------------------------------------------------------
+class User(threading.Thread):
+    """ Browser session that runs the analysis of some pages
+    """
+
+    def __init__(self, app, pages, poll, timeout, stats):
+        super().__init__(daemon=True)
+        self.app = app
+        self.client = app.server.test_client()
+        self.session = [('session-id', 'data', str(uuid.uuid4()))]
+        self.pages = pages
+        self.poll = poll
+        self.timeout = timeout
+        self.stats = stats
+        self.errors = []
+
+    def run(self):
+        try:
+            for page in self.pages:
+                self.analysis(page)
+        except Exception as e:
+            self.errors.append(e)
+
+    def analysis(self, page):
+        button, task, results, interval = PAGES[page]
+        start = time.perf_counter()
+        self.send(page, button, task)
+
+        outputs = [(results[0], 'children'), (interval, 'disabled')] + [
+            (id_, 'data') for id_ in results[1:]
+        ]
+        for n in range(int(self.timeout/self.poll)):
+            latency, response = callback(
+                self.client, outputs,
+                [(interval, 'n_intervals', n), (task, 'children', None)],
+                self.session
+            )
+            self.stats.add(f'{page}: get results', latency)
+            if response['response'][interval]['disabled']:
+                self.stats.add(
+                    f'{page}: time to results', time.perf_counter() - start
+                )
+                return
+            time.sleep(self.poll)
+        raise TimeoutError(f'No {page} results after {self.timeout} seconds')
+
+    def send(self, page, button, task):
+        # The task is sent by a long callback: the click starts a job process
+        # and the callback is then polled on its interval until the job
+        # returned the output
+        key = next(
+            key for key in self.app.callback_map
+            if key.startswith(f'..{task}.children...')
+        )
+        spec = self.app.callback_map[key]
+        outputs = [
+            tuple(dep.rsplit('.', 1)) for dep in key.strip('.').split('...')
+        ]
+        store = {}
+        for n in range(int(self.timeout/self.poll)):
+            latency, response = callback(
+                self.client, outputs,
+                [
+                    (dep['id'], dep['property'],
+                     n if dep['property'] == 'n_intervals' else
+                     int(dep['id'] == button))
+                    for dep in spec['inputs']
+                ],
+                [
+                    (dep['id'], dep['property'],
+                     store if dep['id'] == outputs[-1][0] else
+                     self.session[0][2] if dep['id'] == 'session-id' else
+                     None)
+                    for dep in spec['state']
+                ]
+            )
+            self.stats.add(f'{page}: send task', latency)
+            store = response['response'][outputs[-1][0]]['data']
+            if task in response['response']:
+                return
+            time.sleep(self.poll)
+        raise TimeoutError(f'No {page} task after {self.timeout} seconds')
+
+
+class Stats:
+    """ Thread-safe latencies per callback
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, name, latency):
+        with self._lock:
+            self.latencies[name].append(latency)
+
+    def report(self, elapsed):
+        print(f'{"callback":<32} {"calls":>6} {"calls/s":>8} {"p50 (ms)":>9} '
+              f'{"p95 (ms)":>9} {"p99 (ms)":>9}')
+        for name, latencies in sorted(self.latencies.items()):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])*1e3
+            print(f'{name:<32} {len(latencies):>6} '
+                  f'{len(latencies)/elapsed:>8.1f} {p50:>9.1f} {p95:>9.1f} '
+                  f'{p99:>9.1f}')
+
+
+# ------------------------------------------------------------------------------
+# Run benchmark
+# ------------------------------------------------------------------------------
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument('--users', type=int, default=20,
+                      help='number of concurrent users')
+    args.add_argument('--pages', nargs='+', default=list(PAGES),
+                      choices=list(PAGES), help='pages visited by every user')
+    args.add_argument('--organizations', type=int, default=5,
+                      help='number of organisations in the results')
+    args.add_argument('--survival-points', type=int, default=25,
+                      help='length of the survival curves in the results')
+    args.add_argument('--latency', type=float, default=0.05,
+                      help='seconds added to every vantage6 request')
+    args.add_argument('--duration', type=float, default=2.,
+                      help='seconds before a vantage6 task completes')
+    args.add_argument('--poll', type=float, default=0.5,
+                      help='seconds between two polls of the results')
+    args.add_argument('--timeout', type=float, default=120.,
+                      help='seconds to wait for the results of a task')
+    args.add_argument('--cache', action='store_true',
+                      help='keep the result cache enabled')
+    args = args.parse_args()
+
+    with MockServer(
+        organizations=args.organizations, latency=args.latency,
+        duration=args.duration, survival_points=args.survival_points
+    ) as server:
+        configure(server, args.cache)
+        from index import app
+        from utils.client import client_manager
+
+        # The vantage6 client logs every request at the debug level
+        client_manager.session()
+        logging.getLogger().setLevel(logging.WARNING)
+
+        stats = Stats()
+        users = [
+            User(app, args.pages, args.poll, args.timeout, stats)
+            for _ in range(args.users)
+        ]
+        start = time.perf_counter()
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        elapsed = time.perf_counter() - start
+
+        stats.report(elapsed)
+        errors = [error for user in users for error in user.errors]
+        print(f'\n{args.users} users in {elapsed:.1f} seconds, '
+              f'{server.requests} vantage6 requests of '
+              f'{server.bytes/1e6:.1f} MB, {len(errors)} errors')
+        for error in errors[:5]:
+            print(f'  {error!r}')
+        if errors:
+            sys.exit(f'{len(errors)} users failed')
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-process stand-in for the vantage6 server
+
+It serves the part of the vantage6 REST API used by the dashboard, that is
+authentication, organizations, task creation and status, and results, so the
+real vantage6 client can be used without a server and hospital nodes. Every
+task runs as a master task with one subtask for all organisations, which
+finish one after the other, and completes after a fixed time with synthetic
+results of the statistics, similarity and survival algorithms.
+"""
+import time
+import json
+import pickle
+import itertools
+import threading
+
+from collections import Counter
+from datetime import datetime
+from datetime import timezone
+
+import jwt
+import numpy as np
+
+from flask import Flask
+from flask import jsonify
+from flask import request
+from werkzeug.serving import WSGIRequestHandler
+from werkzeug.serving import make_server
+
+
+STAGES = ['IA1', 'IA2', 'IB', 'IIA', 'IIB', 'IIIA', 'IIIB', 'IVA']
+SECRET = 'mock-vantage6-server'
+
+
+# ------------------------------------------------------------------------------
+# Mock server
+# ------------------------------------------------------------------------------
+class MockServer:
+    """ vantage6 server API running in a background thread
+
+    Parameters
+    ----------
+    organizations : int
+        Number of organisations contributing to the results
+    latency : float
+        Seconds added to every request
+    duration : float
+        Seconds after which a task is complete
+    queue : float
+        Seconds a task waits before the nodes start computing
+    spread : float
+        Fraction of the duration over which the organisations finish, 0 when
+        they all finish at the end
+    survival_points : int
+        Length of the survival curves in the results
+    clusters : int
+        Number of clusters in the similarity results
+    token_lifetime : float
+        Seconds before an access token expires
+
+    The requests served and the bytes of their responses are counted in
+    `requests` and `bytes`, and the results sent with their payload in
+    `downloads`, by result id.
+    """
+
+    def __init__(self, organizations=5, latency=0.05, duration=2., queue=.5,
+                 spread=.8, survival_points=25, clusters=4,
+                 token_lifetime=60*60, host='127.0.0.1', port=0):
+        self.organizations = organizations
+        self.latency = latency
+        self.duration = duration
+        self.queue = min(queue, duration)
+        self.spread = spread
+        self.survival_points = survival_points
+        self.clusters = clusters
+        self.token_lifetime = token_lifetime
+        self.public_key = None
+        self.tasks = {}
+        self.runs = {}
+        self.requests = 0
+        self.bytes = 0
+        self.downloads = Counter()
+        self._ids = itertools.count(1)
+        self._run_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng(0)
+        self._server = make_server(
+            host, port, self._app(), threaded=True,
+            request_handler=_QuietRequestHandler
+        )
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://{self._server.host}'
+
+    @property
+    def port(self):
+        return self._server.port
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='mock-vantage6-server',
+            daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _app(self):
+        app = Flask(__name__)
+
+        @app.before_request
+        def delay():
+            with self._lock:
+                self.requests += 1
+            time.sleep(self.latency)
+
+        @app.after_request
+        def count(response):
+            with self._lock:
+                self.bytes += response.content_length or 0
+            return response
+
+        @app.post('/api/token/user')
+        def token():
+            return jsonify(self._tokens())
+
+        @app.post('/api/token/refresh')
+        def refresh():
+            return jsonify(self._tokens())
+
+        @app.get('/api/user/<int:id_>')
+        def user(id_):
+            return jsonify({
+                'id': id_, 'firstname': 'mock', 'organization': {'id': 1}
+            })
+
+        @app.get('/api/organization')
+        def organizations():
+            return self._page([
+                {'id': id_, 'name': f'centre {id_}'}
+                for id_ in range(1, self.organizations + 1)
+            ])
+
+        @app.route('/api/organization/<int:id_>', methods=['GET', 'PATCH'])
+        def organization(id_):
+            # All organisations share the key uploaded by the user, the
+            # task input is never decrypted by the mock
+            if request.method == 'PATCH':
+                self.public_key = request.json.get('public_key')
+            return jsonify({
+                'id': id_, 'name': f'centre {id_}',
+                'public_key': self.public_key
+            })
+
+        @app.post('/api/task')
+        def create_task():
+            master = self._create(request.json['image'], request.json['name'])
+            return jsonify({'id': master['id'], 'name': master['name']}), 201
+
+        @app.get('/api/task/<int:id_>')
+        def task(id_):
+            task = self.tasks.get(id_)
+            if task is None:
+                return jsonify({'msg': f'task id={id_} not found'}), 404
+            return jsonify(self._task(
+                task, 'results' in request.args.getlist('include')
+            ))
+
+        @app.get('/api/task')
+        def tasks():
+            parent = request.args.get('parent_id', type=int)
+            return self._page([
+                self._task(task) for task in list(self.tasks.values())
+                if parent is None or task['parent'] == parent
+            ])
+
+        @app.get('/api/result')
+        def results():
+            task = self.tasks.get(request.args.get('task_id', type=int))
+            now = time.time()
+            return self._page([
+                self._result(task, run) for run in task['runs']
+                if request.args.get('state') != 'open' or
+                run['finished'] > now
+            ] if task else [])
+
+        @app.get('/api/result/<int:id_>')
+        def result(id_):
+            if id_ not in self.runs:
+                return jsonify({'msg': f'result id={id_} not found'}), 404
+            return jsonify(self._result(*self.runs[id_]))
+
+        return app
+
+    @staticmethod
+    def _page(data):
+        # Like the real server, all items unless a page is requested
+        total = len(data)
+        page = request.args.get('page', type=int)
+        links = {'first': 1}
+        if page:
+            per_page = request.args.get('per_page', 10, type=int)
+            data = data[(page - 1)*per_page:page*per_page]
+            if page*per_page < total:
+                links['next'] = page + 1
+        if 'metadata' not in request.args.getlist('include'):
+            return jsonify(data)
+        return jsonify({'data': data, 'links': links, 'total': total})
+
+    # --------------------------------------------------------------------------
+    # Tokens, tasks and results
+    # --------------------------------------------------------------------------
+    def _tokens(self):
+        now = time.time()
+        payload = {'sub': 1, 'iat': now, 'exp': now + self.token_lifetime}
+        return {
+            'access_token': jwt.encode(payload, SECRET, algorithm='HS256'),
+            'refresh_token': jwt.encode(
+                {**payload, 'type': 'refresh'}, SECRET, algorithm='HS256'
+            ),
+            'refresh_url': '/api/token/refresh', 'user_url': '/api/user/1'
+        }
+
+    def _create(self, image, name):
+        # Master task run by the first organisation, with a subtask for all
+        # organisations that finish one after the other
+        now = time.time()
+        n = self.organizations
+        finished = [
+            now + self.duration*(1 - self.spread + self.spread*(i + 1)/n)
+            for i in range(n)
+        ]
+        centres = self._generate(image)
+        with self._lock:
+            master = self._add(image, name, None, [
+                (1, now + self.queue, now + self.duration, centres)
+            ])
+            self._add(image, f'subtask of {name}', master['id'], [
+                (i + 1, min(now + self.queue, end), end,
+                 centres[i] if isinstance(centres, list) else None)
+                for i, end in enumerate(finished)
+            ])
+        return master
+
+    def _add(self, image, name, parent, runs):
+        id_ = next(self._ids)
+        self.tasks[id_] = {
+            'id': id_, 'image': image, 'name': name, 'parent': parent,
+            'runs': [
+                {
+                    'id': next(self._run_ids), 'organization': organization,
+                    'started': started, 'finished': finished, 'data': data
+                }
+                for organization, started, finished, data in runs
+            ]
+        }
+        for run in self.tasks[id_]['runs']:
+            self.runs[run['id']] = (self.tasks[id_], run)
+        return self.tasks[id_]
+
+    def _task(self, task, include_results=False):
+        # Results are links, unless they are included like the real server
+        # does, payloads and all
+        complete = all(run['finished'] <= time.time() for run in task['runs'])
+        return {
+            'id': task['id'], 'name': task['name'], 'image': task['image'],
+            'parent': {'id': task['parent']} if task['parent'] else None,
+            'complete': complete,
+            'status': 'completed' if complete else 'active',
+            'results': [
+                self._result(task, run) if include_results else
+                {'id': run['id'], 'link': f'/api/result/{run["id"]}'}
+                for run in task['runs']
+            ]
+        }
+
+    def _result(self, task, run):
+        now = time.time()
+        started = run['started'] <= now
+        finished = run['finished'] <= now
+        if finished:
+            with self._lock:
+                if 'payload' not in run:
+                    run['payload'] = self._serialize(run['data'])
+                self.downloads[run['id']] += 1
+        return {
+            'id': run['id'], 'task': {'id': task['id']},
+            'organization': {'id': run['organization']}, 'input': '',
+            'result': self._encrypt(run['payload']) if finished else None,
+            'assigned_at': self._timestamp(task['runs'][0]['started']),
+            'started_at': self._timestamp(run['started']) if started
+            else None,
+            'finished_at': self._timestamp(run['finished']) if finished
+            else None
+        }
+
+    @staticmethod
+    def _timestamp(seconds):
+        return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+    def _generate(self, image):
+        rng = self._rng
+        if 'similarity' in image:
+            return {
+                'centroids': rng.integers(0, 5, (self.clusters, 3)).tolist(),
+                'profiles': [
+                    self._curve() for _ in range(self.clusters)
+                ]
+            }
+        if 'survival' in image:
+            from sklearn.linear_model import LogisticRegression
+
+            X = rng.integers(-1, 5, (500, 3))
+            y = np.where(X.sum(axis=1) + rng.normal(0, 2, 500) > 5,
+                         'dead', 'alive')
+            return {
+                'model': LogisticRegression().fit(X, y),
+                'accuracy': round(float(rng.uniform(0.6, 0.8)), 3)
+            }
+        return [
+            {
+                'organisation': f'centre {i + 1}',
+                'nids': int(rng.integers(50, 1000)),
+                'stage': {
+                    'stage': STAGES,
+                    'id': rng.integers(0, 100, len(STAGES)).tolist()
+                },
+                'vital_status': {
+                    'vital_status': ['alive', 'dead'],
+                    'id': rng.integers(0, 500, 2).tolist()
+                },
+                'survival': self._curve()
+            }
+            for i in range(self.organizations)
+        ]
+
+    def _curve(self):
+        return np.sort(self._rng.random(self.survival_points))[::-1].tolist()
+
+    @staticmethod
+    def _serialize(result):
+        # Same formats as the algorithms, models cannot be sent as JSON
+        try:
+            return b'json.' + json.dumps(result).encode()
+        except TypeError:
+            return b'pickle.' + pickle.dumps(result)
+
+    def _encrypt(self, data):
+        from vantage6.common.encryption import DummyCryptor
+        from vantage6.common.encryption import RSACryptor
+
+        if self.public_key is None:
+            return DummyCryptor().encrypt_bytes_to_str(data, None)
+        # Encrypting only needs the public key of the user, RSACryptor itself
+        # cannot be created without a private key
+        return RSACryptor.encrypt_bytes_to_str(
+            DummyCryptor(), data, self.public_key
+        )
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
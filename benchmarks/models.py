@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the survival model evaluation
+
+Run from the repository root with: python -m benchmarks.models
+"""
+import timeit
+
+import numpy as np
+
+from sklearn.linear_model import LogisticRegression
+
+from utils import cdm
+from utils.models import LinearModel
+
+
+# ------------------------------------------------------------------------------
+# Synthetic model
+# ------------------------------------------------------------------------------
+def synthetic_model(n_patients=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.integers(-1, 5, (n_patients, len(cdm.TNM)))
+    y = np.where(X.sum(axis=1) + rng.normal(0, 2, n_patients) > 4,
+                 'dead', 'alive')
+    return LogisticRegression().fit(X, y)
+
+
+def best(function, number):
+    return min(timeit.repeat(function, number=number, repeat=5))/number
+
+
+# ------------------------------------------------------------------------------
+# Run benchmark
+# ------------------------------------------------------------------------------
+if __name__ == '__main__':
+    model = synthetic_model()
+    linear = LinearModel.from_sklearn(model)
+
+    print(f'{"scoring":<20} {"sklearn (us)":>14} {"numpy (us)":>12} '
+          f'{"speed-up":>10}')
+    for name, X in [('single patient', cdm.grid()[:1]),
+                    ('TNM grid', cdm.grid()),
+                    ('100000 patients',
+                     np.resize(cdm.grid(), (100000, len(cdm.TNM))))]:
+        assert np.allclose(model.predict_proba(X), linear.predict_proba(X))
+        assert (model.predict(X) == linear.predict(X)).all()
+        number = 10 if len(X) > 1000 else 1000
+        sklearn = best(lambda: model.predict_proba(X), number)
+        numpy = best(lambda: linear.predict_proba(X), number)
+        print(f'{name:<20} {sklearn*1e6:>14.1f} {numpy*1e6:>12.1f} '
+              f'{sklearn/numpy:>9.1f}x')
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the downloads needed to retrieve the results of a task
+
+Run from the repository root with: python -m benchmarks.retrieval
+
+It runs statistics tasks with large results on the mock vantage6 server and
+counts the requests and bytes needed to follow the progress of the
+organisations and download the result, once as the pages used to, with the
+results downloaded with every status check and again at the end, and once
+with the task poller.
+"""
+import time
+import logging
+import argparse
+
+from benchmarks import load
+from benchmarks.mock_server import MockServer
+
+
+# ------------------------------------------------------------------------------
+# Retrieval
+# ------------------------------------------------------------------------------
+def previous(client, task_id, poll):
+    # Status with its results, the results of the subtasks for the progress
+    # of the organisations, and the results again once complete
+    while True:
+        task = client.task.get(task_id, include_results=True)
+        subtasks = client.task.list(parent=task_id, include_metadata=False)
+        for subtask in subtasks:
+            client.result.list(task=subtask['id'])
+        if task.get('complete'):
+            results = client.result.list(task=task_id)
+            if isinstance(results, dict):
+                results = results['data']
+            return results[0]
+        time.sleep(poll)
+
+
+def poller_result(client, task_id, poll):
+    from utils.poller import poller
+
+    poller.min_delay = poller.max_delay = poll
+    poller.watch(task_id, partial=True)
+    while True:
+        result = poller.result(task_id)
+        if result is not None:
+            return result
+        time.sleep(poll/10)
+
+
+# ------------------------------------------------------------------------------
+# Run benchmark
+# ------------------------------------------------------------------------------
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument(
+        '--organizations', type=int, default=20,
+        help='number of organisations'
+    )
+    args.add_argument(
+        '--points', type=int, default=20000,
+        help='length of the survival curves in the results'
+    )
+    args.add_argument(
+        '--duration', type=float, default=5., help='seconds a task runs'
+    )
+    args.add_argument(
+        '--poll', type=float, default=.5, help='seconds between checks'
+    )
+    args = args.parse_args()
+
+    with MockServer(
+        organizations=args.organizations, latency=0.,
+        duration=args.duration, queue=.5, survival_points=args.points
+    ) as server:
+        load.configure(server, False)
+        from pages import config
+        from utils.client import client_manager
+
+        # The vantage6 client logs every request at the debug level
+        client = client_manager.session()
+        logging.getLogger().setLevel(logging.WARNING)
+        print(f'{"retrieval":<12} {"requests":>10} {"MB":>10} '
+              f'{"seconds":>10}')
+        for name, retrieve in [('previous', previous),
+                               ('poller', poller_result)]:
+            task = client.task.create(
+                collaboration=config.collaboration,
+                organizations=config.org_ids, name='retrieval benchmark',
+                image=config.image_stat, description='', input={},
+                data_format='json'
+            )
+            requests, size = server.requests, server.bytes
+            start = time.perf_counter()
+            retrieve(client, task['id'], args.poll)
+            print(f'{name:<12} {server.requests - requests:>10} '
+                  f'{(server.bytes - size)/1e6:>10.1f} '
+                  f'{time.perf_counter() - start:>10.1f}')
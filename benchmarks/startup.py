@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""
+Import-time benchmark of the dashboard
+
+Run from the repository root with: python -m benchmarks.startup
+
+It imports the dashboard in a fresh interpreter, reports the modules that
+are the most expensive to import and exits with an error when the startup
+exceeds the time budget, or when a heavy dependency is imported eagerly.
+"""
+import sys
+import argparse
+import subprocess
+
+
+# Dependencies that should only be imported when a callback needs them
+LAZY_MODULES = [
+    'numpy', 'pandas', 'plotly.express', 'scipy', 'sklearn',
+    'vantage6.client'
+]
+
+
+# ------------------------------------------------------------------------------
+# Import times
+# ------------------------------------------------------------------------------
+def import_times(module='index'):
+    """ Self and cumulative import time in seconds of every module
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(own)/1e6, int(cumulative)/1e6)
+    return times
+
+
+# ------------------------------------------------------------------------------
+# Run benchmark
+# ------------------------------------------------------------------------------
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument(
+        '--budget', type=float, default=1.5,
+        help='maximum import time of the dashboard in seconds'
+    )
+    args.add_argument(
+        '--top', type=int, default=15, help='number of modules to report'
+    )
+    args = args.parse_args()
+
+    times = import_times()
+    total = times['index'][1]
+    print(f'{"module":<50} {"self (ms)":>10} {"cumulative (ms)":>16}')
+    ranking = sorted(times.items(), key=lambda item: -item[1][1])
+    for name, (own, cumulative) in ranking[:args.top]:
+        print(f'{name:<50} {own*1e3:>10.1f} {cumulative*1e3:>16.1f}')
+
+    errors = [
+        f'{name} is imported at startup' for name in LAZY_MODULES
+        if name in times
+    ]
+    if total > args.budget:
+        errors.append(
+            f'startup took {total:.3f} seconds, budget is {args.budget} seconds'
+        )
+    print(f'\nDashboard imported in {total:.3f} seconds')
+    if errors:
+        sys.exit('\n'.join(errors))
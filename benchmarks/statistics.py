@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the statistics results parser
+
+Run from the repository root with: python -m benchmarks.statistics
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from utils.results import parse_statistics
+
+
+CUTOFF = 730
+DELTA = 30
+STAGES = ['IA1', 'IA2', 'IB', 'IIA', 'IIB', 'IIIA', 'IIIB', 'IVA']
+
+
+# ------------------------------------------------------------------------------
+# Synthetic results
+# ------------------------------------------------------------------------------
+def synthetic_results(n_orgs, seed=0):
+    rng = np.random.default_rng(seed)
+    n_days = len(range(0, CUTOFF, DELTA))
+    return [
+        {
+            'organisation': f'centre {i}',
+            'nids': int(rng.integers(50, 1000)),
+            'stage': {
+                'stage': STAGES,
+                'id': rng.integers(0, 100, len(STAGES)).tolist()
+            },
+            'vital_status': {
+                'vital_status': ['alive', 'dead'],
+                'id': rng.integers(0, 500, 2).tolist()
+            },
+            'survival': np.sort(rng.random(n_days))[::-1].tolist()
+        }
+        for i in range(n_orgs)
+    ]
+
+
+# ------------------------------------------------------------------------------
+# Previous implementation, one concat per organisation and table
+# ------------------------------------------------------------------------------
+def parse_statistics_loop(results, cutoff, delta):
+    dfg1 = pd.DataFrame({
+        'patients': [r['nids'] for r in results if 'nids' in r.keys()],
+        'centre': [r['organisation'] for r in results]
+    })
+    tables = []
+    for key in ['stage', 'vital_status']:
+        df = pd.DataFrame()
+        for result in results:
+            if key in result.keys():
+                tmp = pd.DataFrame(result[key])
+                tmp['centre'] = result['organisation']
+                df = pd.concat([df, tmp])
+        tables.append(df)
+    dfg4 = pd.DataFrame()
+    for result in results:
+        if 'survival' in result.keys():
+            tmp = pd.DataFrame({
+                'survival rate': result['survival'],
+                'survival days': list(range(0, cutoff, delta))
+            })
+            tmp['centre'] = result['organisation']
+            dfg4 = pd.concat([dfg4, tmp])
+    return dfg1, tables[0], tables[1], dfg4
+
+
+# ------------------------------------------------------------------------------
+# Run benchmark
+# ------------------------------------------------------------------------------
+if __name__ == '__main__':
+    print(f'{"orgs":>6} {"loop (ms)":>12} {"single pass (ms)":>18} '
+          f'{"speed-up":>10}')
+    for n_orgs in [5, 100, 1000]:
+        results = synthetic_results(n_orgs)
+        number = max(1, 200 // n_orgs)
+        loop = min(timeit.repeat(
+            lambda: parse_statistics_loop(results, CUTOFF, DELTA),
+            number=number, repeat=3
+        ))/number
+        single = min(timeit.repeat(
+            lambda: parse_statistics(results, CUTOFF, DELTA),
+            number=number, repeat=3
+        ))/number
+        print(f'{n_orgs:>6} {loop*1e3:>12.2f} {single*1e3:>18.2f} '
+              f'{loop/single:>9.1f}x')
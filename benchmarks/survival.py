@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the pooled survival curve of all centres
+
+Run from the repository root with: python -m benchmarks.survival
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.statistics import CUTOFF
+from benchmarks.statistics import DELTA
+from benchmarks.statistics import synthetic_results
+from utils.results import pool_survival
+
+
+# ------------------------------------------------------------------------------
+# Synthetic results, half of the centres with their own grid of days
+# ------------------------------------------------------------------------------
+def mixed_results(n_orgs, seed=0):
+    rng = np.random.default_rng(seed)
+    results = synthetic_results(n_orgs, seed)
+    for result in results[::2]:
+        days = np.sort(rng.choice(CUTOFF, len(result['survival']) - 1,
+                                  replace=False)) + 1
+        result['survival_days'] = [0] + days.tolist()
+    return results
+
+
+# ------------------------------------------------------------------------------
+# Loop over the centres, one aligned series per centre
+# ------------------------------------------------------------------------------
+def pool_survival_loop(results, cutoff, delta, z=1.96):
+    grid = np.arange(0, cutoff, delta, dtype=float)
+    numerator = pd.Series(0., index=grid)
+    variance = pd.Series(0., index=grid)
+    total = pd.Series(0., index=grid)
+    for result in results:
+        curve = pd.Series(
+            result['survival'],
+            index=result.get('survival_days', grid[:len(result['survival'])])
+        )
+        aligned = curve.reindex(curve.index.union(grid)).ffill()
+        aligned = aligned.reindex(grid).dropna()
+        n = result['nids']
+        numerator = numerator.add(n*aligned, fill_value=0)
+        variance = variance.add(n*aligned*(1 - aligned), fill_value=0)
+        total = total.add(pd.Series(n, index=aligned.index), fill_value=0)
+    pooled = numerator/total
+    error = np.sqrt(variance)/total
+    return pd.DataFrame({
+        'survival days': grid,
+        'survival rate': pooled.values,
+        'lower': (pooled - z*error).clip(0, 1).values,
+        'upper': (pooled + z*error).clip(0, 1).values,
+        'patients': total.values
+    }).dropna()
+
+
+# ------------------------------------------------------------------------------
+# Run benchmark
+# ------------------------------------------------------------------------------
+if __name__ == '__main__':
+    print(f'{"orgs":>6} {"loop (ms)":>12} {"vectorized (ms)":>17} '
+          f'{"speed-up":>10}')
+    for n_orgs in [5, 100, 1000]:
+        results = mixed_results(n_orgs)
+        expected = pool_survival_loop(results, CUTOFF, DELTA)
+        pooled = pool_survival(results, CUTOFF, DELTA)
+        assert np.allclose(expected.values, pooled.values)
+        number = max(1, 200 // n_orgs)
+        loop = min(timeit.repeat(
+            lambda: pool_survival_loop(results, CUTOFF, DELTA),
+            number=number, repeat=3
+        ))/number
+        vectorized = min(timeit.repeat(
+            lambda: pool_survival(results, CUTOFF, DELTA),
+            number=number, repeat=3
+        ))/number
+        print(f'{n_orgs:>6} {loop*1e3:>12.2f} {vectorized*1e3:>17.2f} '
+              f'{loop/vectorized:>9.1f}x')
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""
+Gunicorn settings of the dashboard
+
+The number of workers and threads per worker can be set with the
+WEB_CONCURRENCY and WEB_THREADS environment variables. The workers share
+their Prometheus metrics through PROMETHEUS_MULTIPROC_DIR, a temporary
+directory unless it is set.
+"""
+import os
+import glob
+import tempfile
+
+
+bind = f'0.0.0.0:{os.environ.get("PORT", 5000)}'
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+threads = int(os.environ.get('WEB_THREADS', 4))
+timeout = 120
+preload_app = False
+
+# Must be set before the workers import prometheus_client
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = \
+        tempfile.mkdtemp(prefix='healthai-metrics-')
+metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    # Metrics of a previous run would be reported again, only their files
+    # are removed from a directory set by the operator
+    os.makedirs(metrics_dir, exist_ok=True)
+    for file in glob.glob(os.path.join(metrics_dir, '*.db')):
+        os.remove(file)
+
+
+def post_worker_init(worker):
+    from wsgi import warmup
+    warmup()
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -3,6 +3,7 @@
 """
 HealthAI dashboard index
 """
+import uuid
 
 import dash_bootstrap_components as dbc
 
@@ -12,10 +13,12 @@ from dash.dependencies import Input
 from dash.dependencies import Output
 
 from app import app
+from pages import history
 from pages import home
 from pages import statistics
 from pages import survival
 from pages import similarity
+from utils import export
 
 
 # ------------------------------------------------------------------------------
@@ -49,6 +52,9 @@ sidebar = html.Div(
                 dbc.NavItem(dbc.NavLink(
                     'Similarity', href='/similarity',
                     active='exact'
+                )),
+                dbc.NavItem(dbc.NavLink(
+                    'History', href='/history', active='exact'
                 ))
             ],
             vertical='md',
@@ -69,10 +75,36 @@ CONTENT_STYLE = {
 
 content = html.Div(id='page-content', style=CONTENT_STYLE)
 
+
 # ------------------------------------------------------------------------------
 # Layout
 # ------------------------------------------------------------------------------
-app.layout = html.Div([dcc.Location(id='url', refresh=True), sidebar, content])
+def serve_layout():
+    # A new session identifier is generated for every page load, the store
+    # keeps the first one for the lifetime of the browser tab
+    return html.Div([
+        dcc.Store(
+            id='session-id', storage_type='session', data=str(uuid.uuid4())
+        ),
+        dcc.Location(id='url', refresh=True),
+        sidebar,
+        content
+    ])
+
+
+app.layout = serve_layout
+
+
+# ------------------------------------------------------------------------------
+# Export
+# ------------------------------------------------------------------------------
+export.register(app.server, {
+    name: (page.analysis.cached_result, page.export_tables)
+    for name, page in [
+        ('statistics', statistics), ('similarity', similarity),
+        ('survival', survival)
+    ]
+})
 
 
 # ------------------------------------------------------------------------------
@@ -91,6 +123,8 @@ def render_page_content(pathname):
         return survival.layout
     elif pathname == '/similarity':
         return similarity.layout
+    elif pathname == '/history':
+        return history.layout
     # If the user tries to reach a different page, return a 404 message
     return dbc.Jumbotron([
         html.H1('404: Not found', className='text-danger'),
@@ -25,3 +25,34 @@ k = 4
 epsilon = 0.01
 max_iter = 50
 columns = ['t', 'n', 'm']
+
+# Input for survival
+image_surv = 'ghcr.io/maastrichtu-cds/v6-healthai-survival-analysis-py:latest'
+max_iter_survival = 100
+
+# Result cache
+cache_dir = 'cache'
+cache_ttl = 24*60*60
+
+# Shared state of the worker processes, defaults to cache_dir/state.sqlite
+# state_db = 'cache/state.sqlite'
+
+# History of past runs, defaults to cache_dir/history
+# history_dir = 'cache/history'
+
+# Progress and output of the task dispatch jobs, defaults to cache_dir/jobs
+# jobs_dir = 'cache/jobs'
+
+# Offline mode, the pages show the results saved by snapshot.py without
+# contacting vantage6, snapshots default to input/snapshots
+offline = False
+# snapshot_dir = 'input/snapshots'
+
+# Survival curves are down-sampled to at most this number of points
+max_curve_points = 200
+
+# Rendered figures kept in memory by every worker, see utils/render.py
+render_cache_size = 64
+
+# Processes that decrypt large results, defaults to one per CPU
+# decode_workers = 4
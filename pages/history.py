@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+History of past federated runs
+"""
+from dash import dcc
+from dash import html
+from dash.dependencies import Input
+from dash.dependencies import Output
+from dash.dependencies import State
+
+from pages import config
+from app import app
+from utils.figures import compact
+from utils.history import history
+
+
+ANALYSES = ['statistics', 'similarity', 'survival']
+
+
+# ------------------------------------------------------------------------------
+# History page layout
+# ------------------------------------------------------------------------------
+layout = html.Div([
+    html.H1('History'),
+    html.Hr(),
+    html.P('Compare the results of past runs of an analysis'),
+    html.Div(
+        dcc.Dropdown(
+            options=ANALYSES, value=ANALYSES[0], clearable=False,
+            id='input-history-analysis'
+        ),
+        style={
+            'width': '20%', 'display': 'inline-block',
+            'vertical-align': 'middle'
+        }
+    ),
+    html.Div(
+        dcc.Dropdown(placeholder='Series', id='input-history-series'),
+        style={
+            'width': '30%', 'display': 'inline-block',
+            'vertical-align': 'middle'
+        }
+    ),
+    html.Div(
+        dcc.Dropdown(multi=True, placeholder='Runs', id='input-history-runs'),
+        style={
+            'width': '50%', 'display': 'inline-block',
+            'vertical-align': 'middle'
+        }
+    ),
+    html.P(),
+    dcc.Loading(
+        id='loading-history', type='default',
+        children=html.Div(id='output-history')
+    ),
+    html.P()
+])
+
+
+# ------------------------------------------------------------------------------
+# Figures
+# ------------------------------------------------------------------------------
+def history_figure(analysis, runs, series):
+    """ Overlay of a series in several runs
+
+    Series with one value per centre, like the number of patients, are
+    shown as grouped bars, the others as one line per centre and run.
+    """
+    import plotly.express as px
+
+    labels = {
+        run['run']: f'{run["finished_at"]} (task {run["task_id"]})'
+        for run in history.runs(analysis)
+    }
+    df = history.load(runs, series)
+    df['run'] = df['run'].map(labels)
+    if df.groupby(['run', 'centre']).size().max() == 1:
+        figure = px.bar(
+            df, x='centre', y='value', color='run', barmode='group',
+            labels={'value': series}
+        )
+    else:
+        figure = px.line(
+            df, x='x', y='value', color='centre', line_dash='run',
+            labels={'value': series}
+        )
+    return compact(
+        figure, max_points=getattr(config, 'max_curve_points', None)
+    )
+
+
+# ------------------------------------------------------------------------------
+# Callbacks
+# ------------------------------------------------------------------------------
+@app.callback(
+    [Output('input-history-series', 'options'),
+     Output('input-history-series', 'value'),
+     Output('input-history-runs', 'options'),
+     Output('input-history-runs', 'value')],
+    [Input('input-history-analysis', 'value')]
+)
+def history_runs(analysis):
+    # The latest runs are selected, with the first series they recorded
+    runs = history.runs(analysis)
+    series = sorted({name for run in runs for name in run['series']})
+    options = [
+        {
+            'label': f'{run["finished_at"]} (task {run["task_id"]})',
+            'value': run['run']
+        }
+        for run in runs
+    ]
+    return series, series[0] if series else None, options, [
+        run['run'] for run in runs[:3]
+    ]
+
+
+@app.callback(
+    Output('output-history', 'children'),
+    [Input('input-history-series', 'value'),
+     Input('input-history-runs', 'value')],
+    [State('input-history-analysis', 'value')]
+)
+def get_history(series, runs, analysis):
+    if not series or not runs:
+        return html.Plaintext('No runs recorded yet' if not series else '')
+    return dcc.Graph(figure=history_figure(analysis, runs, series))
@@ -3,8 +3,42 @@
 """
 HealthAI home page
 """
+import time
+import logging
 
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+
+import dash_bootstrap_components as dbc
+
+from dash import dcc
 from dash import html
+from dash.dependencies import Input
+from dash.dependencies import Output
+from dash.dependencies import State
+
+from app import app
+from pages import similarity
+from pages import statistics
+from pages import survival
+from utils.client import client_manager
+from utils.poller import poller
+from utils.snapshots import snapshots
+from utils.state import sessions
+
+
+logger = logging.getLogger(__name__)
+
+# Analyses run by 'Run all analyses', with their page
+ANALYSES = {
+    'statistics': (statistics.analysis.dispatch, '/statistics'),
+    'similarity': (similarity.analysis.dispatch, '/similarity'),
+    'survival': (survival.analysis.dispatch, '/survival'),
+}
+STATUS_COLORS = {
+    'cached': 'info', 'running': 'warning', 'done': 'success',
+    'failed': 'danger'
+}
 
 
 # ------------------------------------------------------------------------------
@@ -13,5 +47,120 @@ from dash import html
 layout = html.Div([
     html.H1('Home'),
     html.Hr(),
-    html.P('HealthAI dashboard for TNM analysis')
+    html.P('HealthAI dashboard for TNM analysis'),
+    dbc.Button('Run all analyses', id='run-all', n_clicks=0),
+    dbc.Button(
+        'Cancel', id='cancel-run-all', n_clicks=0, disabled=True,
+        className='ms-1'
+    ),
+    dbc.Switch(
+        id='refresh-run-all', label='Ignore cached results', value=False,
+        className='mt-2'
+    ),
+    html.Div(id='progress-run-all'),
+    dcc.Loading(
+        id='loading-run-all', type='default',
+        children=html.Div(id='output-run-all')
+    ),
+    html.P(),
+    html.Div(id='output-run-all-status'),
+    dcc.Interval(id='poll-run-all', interval=2000, n_intervals=0),
 ])
+
+
+# ------------------------------------------------------------------------------
+# Callbacks
+# ------------------------------------------------------------------------------
+@app.long_callback(
+    Output('output-run-all', 'children'),
+    [Input('run-all', 'n_clicks')],
+    [State('session-id', 'data'),
+     State('refresh-run-all', 'value')],
+    running=[
+        (Output('run-all', 'disabled'), True, False),
+        (Output('cancel-run-all', 'disabled'), False, True)
+    ],
+    cancel=[Input('cancel-run-all', 'n_clicks')],
+    progress=Output('progress-run-all', 'children'),
+    prevent_initial_call=True
+)
+def run_all(set_progress, n_clicks, session_id, refresh):
+    # Runs in a job process, the tasks are watched by the worker that polls
+    # their status
+    if n_clicks > 0:
+        start = time.time()
+
+        # Authenticate once, the tasks are then sent concurrently over the
+        # same session, each with the state of its page
+        set_progress(html.Plaintext('Connecting to vantage6...'))
+        try:
+            if not snapshots.offline:
+                client_manager.session()
+        except Exception:
+            logger.exception('Could not connect to vantage6')
+        with ThreadPoolExecutor(max_workers=len(ANALYSES)) as pool:
+            futures = {
+                pool.submit(
+                    dispatch, sessions.get(session_id, name), watch=False,
+                    force=refresh
+                ): name
+                for name, (dispatch, _) in ANALYSES.items()
+            }
+            group = {}
+            for future in as_completed(futures):
+                try:
+                    group[futures[future]] = future.result()[0]
+                except Exception:
+                    logger.exception(f'Could not send {futures[future]}')
+                    state = sessions.get(session_id, futures[future])
+                    state['task'] = state['result'] = None
+                    group[futures[future]] = 'failed'
+                set_progress(html.Plaintext(
+                    f'Dispatched {len(group)} out of {len(ANALYSES)} '
+                    'analyses...'
+                ))
+        group = {name: group[name] for name in ANALYSES}
+        sessions.get(session_id, 'home')['group'] = group
+
+        duration = round(time.time() - start, 3)
+        return html.Plaintext(
+            f'Dispatched {len(group)} analyses in {duration} seconds'
+        )
+    else:
+        return html.Plaintext('')
+
+
+@app.callback(
+    [Output('output-run-all-status', 'children'),
+     Output('poll-run-all', 'disabled')],
+    [Input('poll-run-all', 'n_intervals'),
+     Input('output-run-all', 'children')],
+    [State('session-id', 'data')]
+)
+def run_all_status(n_intervals, run_output, session_id):
+    group = sessions.get(session_id, 'home').get('group')
+    if not group:
+        return html.P(), True
+
+    # Each page shows its results as soon as its task is done
+    status = {}
+    for name, sent in group.items():
+        state = sessions.get(session_id, name)
+        task = state.get('task')
+        if sent != 'created':
+            status[name] = sent
+        elif state.get('result') or task and poller.result(task['id']):
+            status[name] = 'done'
+        else:
+            status[name] = 'running'
+
+    return html.Div([
+        dcc.Link(
+            dbc.Badge(
+                f'{name}: {status[name]}', color=STATUS_COLORS[status[name]],
+                className='me-1'
+            ),
+            href=ANALYSES[name][1]
+        )
+        for name in group
+    ]), 'running' not in status.values()
@@ -3,45 +3,22 @@
 """
 TNM patient similarity
 """
-import os
-import re
-import time
-import json
-
-import numpy as np
-import pandas as pd
-import plotly.express as px
 import dash_bootstrap_components as dbc
 
 from dash import dcc
 from dash import html
+from dash import no_update
 from dash.dependencies import Input
 from dash.dependencies import Output
-from dateutil import parser
-from scipy.spatial import distance
-from vantage6.client import Client
+from dash.dependencies import State
 
 from pages import config
 from app import app
-
-
-# ------------------------------------------------------------------------------
-# Global variables
-# ------------------------------------------------------------------------------
-client = None
-task = None
-start = None
-centroids = None
-profiles = None
-
-
-# ------------------------------------------------------------------------------
-# TNM common data model
-# ------------------------------------------------------------------------------
-input_path = os.path.join(os.getcwd(), 'input')
-cdm_file = os.path.join(input_path, 'cdm.json')
-cdm = json.load(open(cdm_file))
-
+from utils import cdm
+from utils.figures import compact
+from utils.render import render_cache
+from utils.state import sessions
+from utils.tasks import Analysis
 
 # ------------------------------------------------------------------------------
 # Patient similarity page layout
@@ -51,6 +28,15 @@ layout = html.Div([
     html.Hr(),
     html.P(),
     dbc.Button('Send task', id='send-task', n_clicks=0),
+    dbc.Button(
+        'Cancel', id='cancel-task', n_clicks=0, disabled=True,
+        className='ms-1'
+    ),
+    dbc.Switch(
+        id='refresh-task', label='Ignore cached results', value=False,
+        className='mt-2'
+    ),
+    html.Div(id='progress-send-task'),
     dcc.Loading(
         id='loading-similarity-task', type='default',
         children=html.Div(id='output-send-task')
@@ -60,11 +46,12 @@ layout = html.Div([
         id='loading-similarity-results', type='default',
         children=html.Div(id='output-similarity-results')
     ),
+    dcc.Interval(id='poll-results', interval=2000, n_intervals=0),
     html.P(),
     html.H4('Patient diagnosed with:'),
     html.Div(
         dcc.Dropdown(
-            options=cdm['t']['values'],
+            options=cdm.values('t'),
             placeholder='T stage',
             id='input-tstage'
         ),
@@ -75,7 +62,7 @@ layout = html.Div([
     ),
     html.Div(
         dcc.Dropdown(
-            options=cdm['n']['values'],
+            options=cdm.values('n'),
             placeholder='N stage',
             id='input-nstage'
         ),
@@ -86,7 +73,7 @@ layout = html.Div([
     ),
     html.Div(
         dcc.Dropdown(
-            options=cdm['m']['values'],
+            options=cdm.values('m'),
             placeholder='M stage',
             id='input-mstage'
         ),
@@ -97,145 +84,201 @@ layout = html.Div([
     ),
     html.P(),
     html.P(),
-    html.Div(id='output-survival-profile'),
+    dcc.Store(id='similarity-lookup'),
+    html.Div([
+        html.H4('Survival profile for similar patients:'),
+        dcc.Graph(id='survival-profile-graph')
+    ],
+        id='output-survival-profile', style={'display': 'none'}
+    ),
     html.P()
 ])
 
 
 # ------------------------------------------------------------------------------
-# Callbacks
+# Survival profiles
 # ------------------------------------------------------------------------------
-@app.callback(
-    Output('output-send-task', 'children'),
-    [Input('send-task', 'n_clicks')]
+def profile_lookup(centroids, profiles):
+    """ Survival profile for every TNM combination of the CDM
+
+    The closest cluster of all combinations is found at once from the full
+    distance matrix to the centroids, and the profile figure is built only
+    once per cluster. The lookup is serializable, to be sent to the browser.
+    """
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+
+    C = np.asarray(centroids, dtype=float)
+
+    # Get closest cluster
+    distances = np.linalg.norm(cdm.grid()[:, np.newaxis, :] - C, axis=2)
+    clusters = np.argmin(distances, axis=1)
+
+    # Survival profile for every cluster
+    figures = []
+    for profile in profiles:
+        dfp = pd.DataFrame({
+            'survival rate': profile,
+            'survival days': list(range(0, config.cutoff, config.delta))
+        })
+        figures.append(compact(px.line(
+            dfp, x='survival days', y='survival rate', range_y=[0, 1]
+        ), max_points=getattr(config, 'max_curve_points', None)))
+
+    return {
+        'clusters': {
+            '|'.join(xi): int(idx)
+            for xi, idx in zip(cdm.combinations, clusters)
+        },
+        'figures': figures
+    }
+
+
+def history_records(result):
+    """ Survival profile of every cluster as records of the history
+    """
+    days = list(range(0, config.cutoff, config.delta))
+    return [
+        ('all centres', f'profile of cluster {k + 1}', days[:len(profile)],
+         profile)
+        for k, profile in enumerate(result['profiles'])
+    ]
+
+
+def export_tables(result_info):
+    """ Tables of a result for the export route, by name
+    """
+    import numpy as np
+    import pandas as pd
+
+    centroids = pd.DataFrame(
+        result_info['result']['centroids'], columns=config.columns
+    )
+    centroids.insert(0, 'cluster', np.arange(1, len(centroids) + 1))
+    profiles = result_info['result']['profiles']
+    days = np.arange(0, config.cutoff, config.delta)
+    lengths = [len(profile) for profile in profiles]
+    return {
+        'centroids': centroids,
+        'profiles': pd.DataFrame({
+            'cluster': np.repeat(np.arange(1, len(profiles) + 1), lengths),
+            'survival days': np.concatenate(
+                [days[:length] for length in lengths]
+            ) if profiles else [],
+            'survival rate': np.concatenate(profiles) if profiles else []
+        })
+    }
+
+
+# ------------------------------------------------------------------------------
+# Task
+# ------------------------------------------------------------------------------
+def similarity_kwargs():
+    """ Keyword arguments of the similarity task
+    """
+    # Vantage6 task that runs TNM patient similarity
+    return {
+        'org_ids': config.org_ids,
+        'k': config.k,
+        'epsilon': config.epsilon,
+        'max_iter': config.max_iter,
+        'columns': config.columns
+    }
+
+
+analysis = Analysis(
+    'similarity', 'image_sim', 'v6-healthai-paient-similarity-py',
+    'run tnm patient similarity', similarity_kwargs,
+    lambda result_info: history_records(result_info['result'])
 )
-def send_similarity_analysis_task(n_clicks):
-    global client
-    global task
-    global start
-
-    if n_clicks > 0:
-        # Initialize the vantage6 client object, and run the authentication
-        client = Client(
-            config.server_url, config.server_port, config.server_api,
-            verbose=True
-        )
-        client.authenticate(config.username, config.password)
-        client.setup_encryption(config.privkey_path)
-
-        # Vantage6 task that runs TNM patient similarity
-        input_ = {
-            'method': 'master',
-            'master': True,
-            'kwargs': {
-                'org_ids': config.org_ids,
-                'k': config.k,
-                'epsilon': config.epsilon,
-                'max_iter': config.max_iter,
-                'columns': config.columns
-            }
-        }
 
-        start = time.time()
-        task = client.task.create(
-            collaboration=config.collaboration,
-            organizations=config.org_ids,
-            name='v6-healthai-paient-similarity-py',
-            image=config.image_sim,
-            description='run tnm patient similarity',
-            input=input_,
-            data_format='json'
-        )
 
-        # Output for UI
-        if task:
-            return html.Div([
-                html.Plaintext('Task was created, waiting for results...'),
-                html.P(),
-                dbc.Button('Get results', id='get-results', n_clicks=0),
-            ])
-        else:
-            return html.Div(
-                html.Plaintext('Something went wrong...')
-            )
-    else:
-        return html.Plaintext('')
+# ------------------------------------------------------------------------------
+# Callbacks
+# ------------------------------------------------------------------------------
+@app.long_callback(
+    Output('output-send-task', 'children'),
+    [Input('send-task', 'n_clicks')],
+    [State('session-id', 'data'),
+     State('refresh-task', 'value')],
+    running=[
+        (Output('send-task', 'disabled'), True, False),
+        (Output('cancel-task', 'disabled'), False, True)
+    ],
+    cancel=[Input('cancel-task', 'n_clicks')],
+    progress=Output('progress-send-task', 'children'),
+    prevent_initial_call=True
+)
+def send_similarity_analysis_task(set_progress, n_clicks, session_id, refresh):
+    return analysis.send(
+        sessions.get(session_id, 'similarity'), n_clicks, set_progress,
+        force=refresh
+    )
 
 
 @app.callback(
-    Output('output-similarity-results', 'children'),
-    [Input('get-results', 'n_clicks')]
+    [Output('output-similarity-results', 'children'),
+     Output('poll-results', 'disabled'),
+     Output('similarity-lookup', 'data')],
+    [Input('poll-results', 'n_intervals'),
+     Input('output-send-task', 'children')],
+    [State('session-id', 'data')]
 )
-def get_similarity_analysis_results(n_clicks):
-    global client
-    global task
-    global start
-    global centroids
-    global profiles
-
-    if n_clicks > 0:
-        # Get results for similarity analysis
-        task_info = client.task.get(task['id'], include_results=True)
-        if task_info.get('complete'):
-            result_info = client.result.list(task=task_info['id'])
-            centroids = result_info['data'][0]['result']['centroids']
-            profiles = result_info['data'][0]['result']['profiles']
-            end = result_info['data'][0]['finished_at']
-            duration = round((parser.parse(end).timestamp() - start)/60., 3)
+def get_similarity_analysis_results(n_intervals, task_output, session_id):
+    state = sessions.get(session_id, 'similarity')
+    result_info = analysis.result(state)
+    task = state.get('task')
+
+    if task or result_info:
+        if result_info:
+            lookup = render_cache.get(
+                render_cache.key(
+                    'similarity', result_info['task']['id'],
+                    result_info['finished_at']
+                ),
+                lambda: profile_lookup(
+                    result_info['result']['centroids'],
+                    result_info['result']['profiles']
+                )
+            )
+            status = analysis.status(state, result_info, minutes=True)
 
         # Output for UI
-        if centroids and profiles:
+        if result_info:
             return html.Div([
-                html.Plaintext(f'Analysis completed in {duration} minutes'),
-            ])
+                html.Plaintext(status),
+            ]), True, lookup
         else:
             return html.Div(
-                html.Plaintext('Still waiting for results, try again later...')
-            )
+                html.Plaintext('Still waiting for results...')
+            ), False, no_update
     else:
-        return html.Plaintext('')
+        return html.Plaintext(analysis.failure(state)), True, None
 
 
-@app.callback(
-    Output('output-survival-profile', 'children'),
+# ------------------------------------------------------------------------------
+# Clientside callbacks
+# ------------------------------------------------------------------------------
+# The survival profile of every TNM combination is shipped to the browser
+# once, dropdown changes are resolved there without a server round-trip
+app.clientside_callback(
+    """
+    function(t, n, m, lookup) {
+        if (t && n && m && lookup) {
+            const cluster = lookup.clusters[[t, n, m].join('|')];
+            return [lookup.figures[cluster], {
+                'width': '50%', 'display': 'inline-block',
+                'vertical-align': 'middle'
+            }];
+        }
+        return [{}, {'display': 'none'}];
+    }
+    """,
+    [Output('survival-profile-graph', 'figure'),
+     Output('output-survival-profile', 'style')],
     [Input('input-tstage', 'value'),
      Input('input-nstage', 'value'),
-     Input('input-mstage', 'value')]
+     Input('input-mstage', 'value'),
+     Input('similarity-lookup', 'data')]
 )
-def survival_profile(t, n, m):
-    if t and n and m:
-        # Convert from categorical to numerical TNM
-        t = re.compile(r'\d').findall(t)
-        t = int(t[0]) if len(t) != 0 else -1
-        n = re.compile(r'\d').findall(n)
-        n = int(n[0]) if len(n) != 0 else -1
-        m = re.compile(r'\d').findall(m)
-        m = int(m[0]) if len(m) != 0 else -1
-
-        # Get closest cluster
-        xi = [t, n, m]
-        distances = [distance.euclidean(xi, xj) for xj in centroids]
-        idx = np.argmin(distances)
-
-        # Survival profile for the closest cluster
-        dfp = pd.DataFrame({
-            'survival rate': profiles[idx],
-            'survival days': list(range(0, config.cutoff, config.delta))
-        })
-
-        # Output for UI
-        return html.Div([
-            html.H4('Survival profile for similar patients:'),
-            dcc.Graph(
-                figure=px.line(
-                    dfp, x='survival days', y='survival rate', range_y=[0, 1]
-                )
-            ),
-        ],
-            style={
-                'width': '50%', 'display': 'inline-block',
-                'vertical-align': 'middle'
-            }
-        )
-    else:
-        return html.Plaintext('')
@@ -3,30 +3,24 @@
 """
 TNM statistics
 """
-import time
-
-import pandas as pd
-import plotly.express as px
 import dash_bootstrap_components as dbc
 
 from dash import dcc
 from dash import html
+from dash import no_update
 from dash.dependencies import Input
 from dash.dependencies import Output
-from dateutil import parser
-from vantage6.client import Client
+from dash.dependencies import State
 
 from pages import config
 from app import app
-
-
-# ------------------------------------------------------------------------------
-# Global variables
-# ------------------------------------------------------------------------------
-client = None
-task = None
-start = None
-
+from utils.figures import compact
+from utils.poller import poller
+from utils.render import render_cache
+from utils.results import parse_statistics
+from utils.results import pool_survival
+from utils.state import sessions
+from utils.tasks import Analysis
 
 # ------------------------------------------------------------------------------
 # Statistics page layout
@@ -36,194 +30,250 @@ layout = html.Div([
     html.Hr(),
     html.P(),
     dbc.Button('Send task', id='send-stats-task', n_clicks=0),
+    dbc.Button(
+        'Cancel', id='cancel-stats-task', n_clicks=0, disabled=True,
+        className='ms-1'
+    ),
+    dbc.Switch(
+        id='refresh-stats-task', label='Ignore cached results', value=False,
+        className='mt-2'
+    ),
+    html.Div(id='progress-statistics-task'),
     dcc.Loading(
         id='loading-statistics-task', type='default',
         children=html.Div(id='output-statistics-task')
     ),
     html.P(),
-    dcc.Loading(
-        id='loading-statistics-results', type='default',
-        children=html.Div(id='output-statistics')
-    ),
+    html.Div(id='output-statistics'),
+    dcc.Interval(id='poll-results2', interval=2000, n_intervals=0),
     html.P()
 ])
 
 
 # ------------------------------------------------------------------------------
-# Callbacks
+# Figures
 # ------------------------------------------------------------------------------
-@app.callback(
-    Output('output-statistics-task', 'children'),
-    [Input('send-stats-task', 'n_clicks')]
-)
-def send_statistics_task(n_clicks):
-    global client
-    global task
-    global start
-
-    if n_clicks > 0:
-        # Initialize the vantage6 client object, and run the authentication
-        client = Client(
-            config.server_url, config.server_port, config.server_api,
-            verbose=True
+STATUS_COLORS = {
+    'pending': 'secondary', 'running': 'warning', 'done': 'success',
+    'failed': 'danger'
+}
+
+
+def centre_status(progress):
+    """ Pending, running or done indicator of every centre
+    """
+    return html.Div([
+        dbc.Badge(
+            f'{centre["name"]}: {centre["status"]}',
+            color=STATUS_COLORS[centre['status']], className='me-1'
         )
-        client.authenticate(config.username, config.password)
-        client.setup_encryption(config.privkey_path)
-
-        # Input for task that retrieves the statistics
-        input_ = {
-            'method': 'master',
-            'master': True,
-            'kwargs': {
-                'org_ids': config.org_ids,
-                'cutoff': config.cutoff,
-                'delta': config.delta
+        for centre in progress
+    ])
+
+
+def statistics_figures(results):
+    """ Charts of the statistics of the centres in the results
+    """
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    # Patients per centre, per stage, per vital status and survival rate
+    # profile per centre, parsed in a single pass. The partial results of
+    # the centres that are done may not have all of them yet
+    dfg1, dfg2, dfg3, dfg4 = parse_statistics(
+        results, config.cutoff, config.delta
+    )
+    figures = [px.bar(dfg1, x='centre', y='patients')]
+    for df, column in [(dfg2, 'stage'), (dfg3, 'vital status')]:
+        if column in df.columns:
+            figures.append(
+                px.bar(df, x='centre', y='patients', color=column)
+            )
+    if len(dfg4):
+        figures.append(px.line(
+            dfg4, x='survival days', y='survival rate', range_y=[0, 1],
+            color='centre'
+        ))
+
+    # Survival rate of all centres, weighted by their number of patients
+    pooled = pool_survival(results, config.cutoff, config.delta)
+    if len(dfg4) and len(pooled):
+        days = pooled['survival days']
+        figures[-1].add_traces([
+            go.Scatter(
+                x=days, y=pooled['upper'], mode='lines', line_width=0,
+                showlegend=False, hoverinfo='skip'
+            ),
+            go.Scatter(
+                x=days, y=pooled['lower'], mode='lines', line_width=0,
+                fill='tonexty', fillcolor='rgba(0, 0, 0, 0.15)',
+                name='95% band', hoverinfo='skip'
+            ),
+            go.Scatter(
+                x=days, y=pooled['survival rate'], mode='lines',
+                line={'color': 'black', 'width': 3}, name='pooled'
+            )
+        ])
+    return [
+        html.Div([
+            dcc.Graph(figure=compact(
+                figure, max_points=getattr(config, 'max_curve_points', None)
+            )),
+        ],
+            style={
+                'width': '49%', 'display': 'inline-block',
+                'vertical-align': 'middle'
             }
-        }
-
-        # Create task to compute statistics
-        start = time.time()
-        task = client.task.create(
-            collaboration=config.collaboration,
-            organizations=config.org_ids,
-            name='v6-healthai-dashboard-py',
-            image=config.image_stat,
-            description='get tnm statistics',
-            input=input_,
-            data_format='json'
         )
+        for figure in figures
+    ]
 
-        # Output for UI
-        if task:
-            return html.Div([
-                html.Plaintext('Task was created, waiting for results...'),
-                html.P(),
-                dbc.Button('Get results', id='get-results2', n_clicks=0),
-            ])
-        else:
-            return html.Div(
-                html.Plaintext('Something went wrong...')
+
+def history_records(results):
+    """ Statistics of the centres as records of the history
+    """
+    dfg1, dfg2, dfg3, dfg4 = parse_statistics(
+        results, config.cutoff, config.delta
+    )
+    records = [
+        (centre, 'patients', 0, patients)
+        for centre, patients in zip(dfg1['centre'], dfg1['patients'])
+    ]
+    for df, column in [(dfg2, 'stage'), (dfg3, 'vital status')]:
+        if column in df.columns:
+            records.extend(
+                (centre, f'{column} {value}', 0, patients)
+                for centre, value, patients in zip(
+                    df['centre'], df[column], df['patients']
+                )
             )
-    else:
-        return html.Plaintext('')
+    records.extend(
+        (centre, 'survival rate', df['survival days'], df['survival rate'])
+        for centre, df in dfg4.groupby('centre', sort=False)
+    )
+    return records
+
+
+def export_tables(result_info):
+    """ Tables of a result for the export route, by name
+    """
+    results = result_info['result']
+    dfg1, dfg2, dfg3, dfg4 = parse_statistics(
+        results, config.cutoff, config.delta
+    )
+    return {
+        'patients': dfg1, 'stage': dfg2, 'vital_status': dfg3,
+        'survival': dfg4,
+        'pooled_survival': pool_survival(results, config.cutoff, config.delta)
+    }
+
+
+# ------------------------------------------------------------------------------
+# Task
+# ------------------------------------------------------------------------------
+def statistics_kwargs():
+    """ Keyword arguments of the statistics task
+    """
+    # Input for task that retrieves the statistics
+    return {
+        'org_ids': config.org_ids,
+        'cutoff': config.cutoff,
+        'delta': config.delta
+    }
+
+
+analysis = Analysis(
+    'statistics', 'image_stat', 'v6-healthai-dashboard-py',
+    'get tnm statistics', statistics_kwargs,
+    lambda result_info: history_records(result_info['result']), partial=True
+)
+
+
+# ------------------------------------------------------------------------------
+# Callbacks
+# ------------------------------------------------------------------------------
+@app.long_callback(
+    Output('output-statistics-task', 'children'),
+    [Input('send-stats-task', 'n_clicks')],
+    [State('session-id', 'data'),
+     State('refresh-stats-task', 'value')],
+    running=[
+        (Output('send-stats-task', 'disabled'), True, False),
+        (Output('cancel-stats-task', 'disabled'), False, True)
+    ],
+    cancel=[Input('cancel-stats-task', 'n_clicks')],
+    progress=Output('progress-statistics-task', 'children'),
+    prevent_initial_call=True
+)
+def send_statistics_task(set_progress, n_clicks, session_id, refresh):
+    return analysis.send(
+        sessions.get(session_id, 'statistics'), n_clicks, set_progress,
+        force=refresh
+    )
 
 
 @app.callback(
-    Output('output-statistics', 'children'),
-    [Input('get-results2', 'n_clicks')]
+    [Output('output-statistics', 'children'),
+     Output('poll-results2', 'disabled')],
+    [Input('poll-results2', 'n_intervals'),
+     Input('output-statistics-task', 'children')],
+    [State('session-id', 'data')]
 )
-def get_statistics(n_clicks):
-    global client
-    global task
-    global start
-
-    if n_clicks > 0:
-        # Get results
-        task_info = client.task.get(task['id'], include_results=True)
+def get_statistics(n_intervals, task_output, session_id):
+    state = sessions.get(session_id, 'statistics')
+    result_info = analysis.result(state)
+    task = state.get('task')
+
+    if task or result_info:
+        # Centres that already finished are shown before the others
+        progress = poller.progress(task['id']) if task else []
         results = None
-        if task_info.get('complete'):
-            result_info = client.result.list(task=task_info['id'])
-            results = result_info['data'][0]['result']
-            end = result_info['data'][0]['finished_at']
-            duration = round((parser.parse(end).timestamp() - start), 3)
-
-            # Patients per centre
-            dfg1 = pd.DataFrame({
-                'patients': [
-                    result['nids'] for result in results
-                    if 'nids' in result.keys()
-                ],
-                'centre': [result['organisation'] for result in results]
-            })
-
-            # Patients per centre per stage
-            dfg2 = pd.DataFrame()
-            for result in results:
-                if 'stage' in result.keys():
-                    print(f'Came here for {result}')
-                    tmp = pd.DataFrame(result['stage'])
-                    tmp['centre'] = result['organisation']
-                    dfg2 = dfg2.append(tmp)
-            dfg2.rename(columns={'id': 'patients'}, inplace=True)
-
-            # Patients per centre per vital status
-            dfg3 = pd.DataFrame()
-            for result in results:
-                if 'vital_status' in result.keys():
-                    tmp = pd.DataFrame(result['vital_status'])
-                    tmp['centre'] = result['organisation']
-                    dfg3 = dfg3.append(tmp)
-            dfg3.rename(
-                columns={'id': 'patients', 'vital_status': 'vital status'},
-                inplace=True
-            )
+        if result_info:
+            results = result_info['result']
+            status = analysis.status(state, result_info)
+        else:
+            # Polls only send the partial results again once a centre
+            # changed, the page shows them until then
+            signature = [task['id']] + [
+                (centre['organization'], centre['status'],
+                 centre['result'] is not None)
+                for centre in progress
+            ]
+            if n_intervals and signature == state.get('progress'):
+                return no_update, False
+            state['progress'] = signature
+            results = []
+            for centre in progress:
+                if isinstance(centre['result'], list):
+                    results.extend(centre['result'])
+                elif isinstance(centre['result'], dict):
+                    results.append(centre['result'])
+            done = len([c for c in progress if c['status'] == 'done'])
+            status = f'Results of {done} out of {len(progress)} centres, ' \
+                     'waiting for the others...'
 
-            # Survival rate profile per centre
-            dfg4 = pd.DataFrame()
-            for result in results:
-                if 'survival' in result.keys():
-                    tmp = pd.DataFrame({
-                        'survival rate': result['survival'],
-                        'survival days':
-                            list(range(0, config.cutoff, config.delta))
-                    })
-                    tmp['centre'] = result['organisation']
-                    dfg4 = dfg4.append(tmp)
-
-        # Output for UI
+        # Output for UI, the figures of a complete result are rendered once
+        if result_info:
+            figures = render_cache.get(
+                render_cache.key(
+                    'statistics', result_info['task']['id'],
+                    result_info['finished_at']
+                ),
+                lambda: statistics_figures(results)
+            )
+        elif results:
+            figures = statistics_figures(results)
         if results:
             return html.Div([
-                html.Plaintext(f'Analysis completed in {duration} seconds'),
+                html.Plaintext(status),
+                centre_status(progress),
                 html.P(),
-                html.Div([
-                    dcc.Graph(
-                        figure=px.bar(dfg1, x='centre', y='patients')
-                    ),
-                ],
-                    style={
-                        'width': '49%', 'display': 'inline-block',
-                        'vertical-align': 'middle'
-                    }
-                ),
-                html.Div([
-                    dcc.Graph(
-                        figure=px.bar(dfg2, x='centre', y='patients',
-                                      color='stage')
-                    ),
-                ],
-                    style={
-                        'width': '49%', 'display': 'inline-block',
-                        'vertical-align': 'middle'
-                    }
-                ),
-                html.Div([
-                    dcc.Graph(
-                        figure=px.bar(dfg3, x='centre', y='patients',
-                                      color='vital status')
-                    ),
-                ],
-                    style={
-                        'width': '49%', 'display': 'inline-block',
-                        'vertical-align': 'middle'
-                    }
-                ),
-                html.Div([
-                    dcc.Graph(
-                        figure=px.line(
-                            dfg4, x='survival days', y='survival rate',
-                            range_y=[0, 1], color='centre'
-                        )
-                    ),
-                ],
-                    style={
-                        'width': '49%', 'display': 'inline-block',
-                        'vertical-align': 'middle'
-                    }
-                )
-            ])
+                *figures
+            ]), result_info is not None
         else:
-            return html.Div(
-                html.Plaintext('Still waiting for results, try again later...')
-            )
+            return html.Div([
+                html.Plaintext('Still waiting for results...'),
+                centre_status(progress)
+            ]), False
     else:
-        return html.Plaintext('')
+        return html.Plaintext(analysis.failure(state)), True
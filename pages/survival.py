@@ -3,44 +3,23 @@
 """
 TNM patient survival
 """
-import os
-import re
-import time
-import json
-
-import numpy as np
 import dash_bootstrap_components as dbc
-import plotly.graph_objects as go
 
 from dash import dcc
 from dash import html
+from dash import no_update
 from dash.dependencies import Input
 from dash.dependencies import Output
-from dateutil import parser
-from vantage6.client import Client
-from sklearn.linear_model import LogisticRegression
+from dash.dependencies import State
 
 from pages import config
 from app import app
-
-
-# ------------------------------------------------------------------------------
-# Global variables
-# ------------------------------------------------------------------------------
-client = None
-task = None
-start = None
-model = None
-accuracy = None
-
-
-# ------------------------------------------------------------------------------
-# TNM common data model
-# ------------------------------------------------------------------------------
-input_path = os.path.join(os.getcwd(), 'input')
-cdm_file = os.path.join(input_path, 'cdm.json')
-cdm = json.load(open(cdm_file))
-
+from utils import cdm
+from utils.figures import compact
+from utils.models import model_store
+from utils.render import render_cache
+from utils.state import sessions
+from utils.tasks import Analysis
 
 # ------------------------------------------------------------------------------
 # Patient survival page layout
@@ -50,6 +29,15 @@ layout = html.Div([
     html.Hr(),
     html.P(),
     dbc.Button('Send task', id='send-task3', n_clicks=0),
+    dbc.Button(
+        'Cancel', id='cancel-task3', n_clicks=0, disabled=True,
+        className='ms-1'
+    ),
+    dbc.Switch(
+        id='refresh-task3', label='Ignore cached results', value=False,
+        className='mt-2'
+    ),
+    html.Div(id='progress-send-task3'),
     dcc.Loading(
         id='loading-survival-task', type='default',
         children=html.Div(id='output-send-task3')
@@ -59,11 +47,12 @@ layout = html.Div([
         id='loading-survival-results', type='default',
         children=html.Div(id='output-survival-results')
     ),
+    dcc.Interval(id='poll-results3', interval=2000, n_intervals=0),
     html.P(),
     html.H4('Patient diagnosed with:'),
     html.Div(
         dcc.Dropdown(
-            options=cdm['t']['values'],
+            options=cdm.values('t'),
             placeholder='T stage',
             id='input-tstage3'
         ),
@@ -74,7 +63,7 @@ layout = html.Div([
     ),
     html.Div(
         dcc.Dropdown(
-            options=cdm['n']['values'],
+            options=cdm.values('n'),
             placeholder='N stage',
             id='input-nstage3'
         ),
@@ -85,7 +74,7 @@ layout = html.Div([
     ),
     html.Div(
         dcc.Dropdown(
-            options=cdm['m']['values'],
+            options=cdm.values('m'),
             placeholder='M stage',
             id='input-mstage3'
         ),
@@ -96,148 +85,278 @@ layout = html.Div([
     ),
     html.P(),
     html.P(),
-    html.Div(id='output-2years-survival'),
+    dcc.Store(id='survival-lookup'),
+    html.Div([
+        html.H4('Patient 2-years survival prediction:'),
+        dcc.Graph(id='survival-prediction-table')
+    ],
+        id='output-2years-survival', style={'display': 'none'}
+    ),
     html.P()
 ])
 
 
 # ------------------------------------------------------------------------------
-# Callbacks
+# Survival predictions
 # ------------------------------------------------------------------------------
-@app.callback(
-    Output('output-send-task3', 'children'),
-    [Input('send-task3', 'n_clicks')]
-)
-def send_survival_analysis_task(n_clicks):
-    global client
-    global task
-    global start
-
-    if n_clicks > 0:
-        # Initialize the vantage6 client object, and run the authentication
-        client = Client(
-            config.server_url, config.server_port, config.server_api,
-            verbose=True
+def prediction_grid(model):
+    """ Evaluate the model once for every TNM combination of the CDM
+
+    Returns the predicted vital status and its probability per combination,
+    formatted for the prediction table and keyed by 'T|N|M', and the
+    2-years survival probability as a T x N x M array. The model is either
+    a scikit-learn classifier or a `LinearModel` from the model store.
+    """
+    import numpy as np
+
+    # Get predictions based on model, in one batch
+    vital_status = model.predict(cdm.grid())
+    survival_prob = model.predict_proba(cdm.grid())
+    classes = model.classes_
+
+    # Probability of the predicted class
+    predicted = np.argmax(classes == vital_status[:, np.newaxis], axis=1)
+    prob = survival_prob[np.arange(len(cdm.combinations)), predicted]*100.
+
+    # Survival is the 'alive' vital status, otherwise the positive class
+    alive = np.flatnonzero(classes == 'alive')
+    survival = survival_prob[:, alive[0] if len(alive) else -1]*100.
+
+    return {
+        'predictions': {
+            '|'.join(xi): [str(status), f'{round(p, 2)}%']
+            for xi, status, p in zip(cdm.combinations, vital_status, prob)
+        },
+        'survival': survival.reshape(
+            [len(cdm.values(name)) for name in cdm.TNM]
         )
-        client.authenticate(config.username, config.password)
-        client.setup_encryption(config.privkey_path)
-
-        # Vantage6 task that runs NSCLC 2-years survival
-        input_ = {
-            'method': 'master',
-            'master': True,
-            'kwargs': {
-                'org_ids': config.org_ids,
-                'max_iter': config.max_iter_survival,
-            }
-        }
+    }
+
 
-        start = time.time()
-        task = client.task.create(
-            collaboration=config.collaboration,
-            organizations=config.org_ids,
-            name='v6-healthai-survival-analysis-py',
-            image=config.image_surv,
-            description='run nsclc survival analysis',
-            input=input_,
-            data_format='json'
+def survival_heatmap(grid):
+    """ Heatmap of the 2-years survival probability, one panel per M stage
+    """
+    import plotly.graph_objects as go
+
+    from plotly.subplots import make_subplots
+
+    m_values = cdm.values('m')
+    figure = make_subplots(
+        rows=1, cols=len(m_values), shared_yaxes=True,
+        subplot_titles=m_values, horizontal_spacing=0.02
+    )
+    for i in range(len(m_values)):
+        figure.add_trace(
+            go.Heatmap(
+                z=grid['survival'][:, :, i], x=cdm.values('n'),
+                y=cdm.values('t'), coloraxis='coloraxis',
+                hovertemplate='%{y} %{x}: %{z:.1f}%<extra></extra>'
+            ),
+            row=1, col=i + 1
         )
+    figure.update_layout(coloraxis={'cmin': 0, 'cmax': 100})
+    return compact(figure)
 
-        # Output for UI
-        if task:
-            return html.Div([
-                html.Plaintext('Task was created, waiting for results...'),
-                html.P(),
-                dbc.Button('Get results', id='get-results3', n_clicks=0),
-            ])
-        else:
-            return html.Div(
-                html.Plaintext('Something went wrong...')
-            )
-    else:
-        return html.Plaintext('')
+
+def survival_model(result_info):
+    """ Model of a survival result, from the model store when possible
+
+    The coefficients of a newly fetched model are stored under the id of
+    its task, so the model is available again after a restart.
+    """
+    task_id = result_info['task']['id']
+    stored = model_store.get(task_id)
+    if stored is not None:
+        return stored[0]
+    return model_store.put(
+        task_id, result_info['result']['model'],
+        accuracy=result_info['result']['accuracy'],
+        finished_at=result_info['finished_at']
+    )
+
+
+def history_records(result_info):
+    """ Accuracy and survival predictions as records of the history
+
+    The predictions follow the order of the TNM combinations of the CDM.
+    """
+    grid = prediction_grid(survival_model(result_info))
+    survival = grid['survival'].ravel()
+    return [
+        ('all centres', 'accuracy', 0, result_info['result']['accuracy']),
+        ('all centres', '2-years survival', range(len(survival)), survival)
+    ]
+
+
+def survival_render(task_id, finished_at, model, accuracy):
+    """ Heatmap of the predictions of a model and their lookup table
+
+    Both are rendered once per result, see `render_cache`.
+    """
+    def render():
+        grid = prediction_grid(model())
+        return survival_heatmap(grid), {
+            'predictions': grid['predictions'],
+            'accuracy': f'{round(accuracy, 2)}'
+        }
+    return render_cache.get(
+        render_cache.key('survival', task_id, finished_at), render
+    )
+
+
+def survival_output(status, figure):
+    """ Results of the page
+    """
+    return html.Div([
+        html.Plaintext(status),
+        html.P(),
+        html.H4('Predicted 2-years survival probability:'),
+        dcc.Graph(figure=figure)
+    ])
+
+
+def export_tables(result_info):
+    """ Tables of a result for the export route, by name
+    """
+    import pandas as pd
+
+    grid = prediction_grid(survival_model(result_info))
+    stages = list(zip(*cdm.combinations))
+    return {
+        'predictions': pd.DataFrame({
+            **{name: stages[i] for i, name in enumerate(cdm.TNM)},
+            'vital status': [
+                prediction[0] for prediction in grid['predictions'].values()
+            ],
+            'survival probability': grid['survival'].ravel()
+        })
+    }
+
+
+# ------------------------------------------------------------------------------
+# Task
+# ------------------------------------------------------------------------------
+def survival_kwargs():
+    """ Keyword arguments of the survival task
+    """
+    # Vantage6 task that runs NSCLC 2-years survival
+    return {
+        'org_ids': config.org_ids,
+        'max_iter': config.max_iter_survival,
+    }
+
+
+analysis = Analysis(
+    'survival', 'image_surv', 'v6-healthai-survival-analysis-py',
+    'run nsclc survival analysis', survival_kwargs,
+    history_records
+)
+
+
+# ------------------------------------------------------------------------------
+# Callbacks
+# ------------------------------------------------------------------------------
+@app.long_callback(
+    Output('output-send-task3', 'children'),
+    [Input('send-task3', 'n_clicks')],
+    [State('session-id', 'data'),
+     State('refresh-task3', 'value')],
+    running=[
+        (Output('send-task3', 'disabled'), True, False),
+        (Output('cancel-task3', 'disabled'), False, True)
+    ],
+    cancel=[Input('cancel-task3', 'n_clicks')],
+    progress=Output('progress-send-task3', 'children'),
+    prevent_initial_call=True
+)
+def send_survival_analysis_task(set_progress, n_clicks, session_id, refresh):
+    return analysis.send(
+        sessions.get(session_id, 'survival'), n_clicks, set_progress,
+        force=refresh
+    )
 
 
 @app.callback(
-    Output('output-survival-results', 'children'),
-    [Input('get-results3', 'n_clicks')]
+    [Output('output-survival-results', 'children'),
+     Output('poll-results3', 'disabled'),
+     Output('survival-lookup', 'data')],
+    [Input('poll-results3', 'n_intervals'),
+     Input('output-send-task3', 'children')],
+    [State('session-id', 'data')]
 )
-def get_survival_analysis_results(n_clicks):
-    global client
-    global task
-    global start
-    global model
-    global accuracy
-
-    if n_clicks > 0:
-        # Get results for survival analysis
-        task_info = client.task.get(task['id'], include_results=True)
-        if task_info.get('complete'):
-            result_info = client.result.list(task=task_info['id'])
-            model = result_info['data'][0]['result']['model']
-            accuracy = result_info['data'][0]['result']['accuracy']
-            end = result_info['data'][0]['finished_at']
-            duration = round((parser.parse(end).timestamp() - start)/60., 3)
+def get_survival_analysis_results(n_intervals, task_output, session_id):
+    state = sessions.get(session_id, 'survival')
+    result_info = analysis.result(state)
+    task = state.get('task')
+
+    if task or result_info:
+        if result_info:
+            status = analysis.status(state, result_info, minutes=True)
 
         # Output for UI
-        if model:
-            return html.Div([
-                html.Plaintext(f'Analysis completed in {duration} minutes'),
-            ])
+        if result_info:
+            figure, lookup = survival_render(
+                result_info['task']['id'], result_info['finished_at'],
+                lambda: survival_model(result_info),
+                result_info['result']['accuracy']
+            )
+            return survival_output(status, figure), True, lookup
         else:
             return html.Div(
-                html.Plaintext('Still waiting for results, try again later...')
-            )
+                html.Plaintext('Still waiting for results...')
+            ), False, no_update
     else:
-        return html.Plaintext('')
+        # Show the predictions of the latest model until a task is sent,
+        # it is loaded from the model store without fetching its result
+        latest = model_store.latest()
+        if latest is None:
+            return html.Plaintext(analysis.failure(state)), True, None
+        task_id, model, info = latest
+        figure, lookup = survival_render(
+            task_id, info['finished_at'], lambda: model, info['accuracy']
+        )
+        return survival_output(
+            analysis.failure(state) or
+            f'Latest model, of task {task_id} finished at '
+            f'{info["finished_at"]}', figure
+        ), True, lookup
 
 
-@app.callback(
-    Output('output-2years-survival', 'children'),
+# ------------------------------------------------------------------------------
+# Clientside callbacks
+# ------------------------------------------------------------------------------
+# The prediction of every TNM combination is shipped to the browser once,
+# dropdown changes are resolved there without a server round-trip
+app.clientside_callback(
+    """
+    function(t, n, m, lookup) {
+        if (t && n && m && lookup) {
+            const prediction = lookup.predictions[[t, n, m].join('|')];
+            const table = {
+                'data': [{
+                    'type': 'table',
+                    'header': {
+                        'values': ['Vital status', 'Probability', 'Accuracy']
+                    },
+                    'cells': {
+                        'values': [
+                            [prediction[0]], [prediction[1]], [lookup.accuracy]
+                        ]
+                    }
+                }]
+            };
+            return [table, {
+                'width': '50%', 'display': 'inline-block',
+                'vertical-align': 'middle'
+            }];
+        }
+        return [{}, {'display': 'none'}];
+    }
+    """,
+    [Output('survival-prediction-table', 'figure'),
+     Output('output-2years-survival', 'style')],
     [Input('input-tstage3', 'value'),
      Input('input-nstage3', 'value'),
-     Input('input-mstage3', 'value')]
+     Input('input-mstage3', 'value'),
+     Input('survival-lookup', 'data')]
 )
-def survival_analysis(t, n, m):
-    global model
-    global accuracy
-
-    if t and n and m:
-        # Convert from categorical to numerical TNM
-        t = re.compile(r'\d').findall(t)
-        t = int(t[0]) if len(t) != 0 else -1
-        n = re.compile(r'\d').findall(n)
-        n = int(n[0]) if len(n) != 0 else -1
-        m = re.compile(r'\d').findall(m)
-        m = int(m[0]) if len(m) != 0 else -1
-
-        # Get prediction based on model
-        X = np.array([[t, n, m]])
-        vital_status = model.predict(X)
-        survival_prob = model.predict_proba(X)
-        classes = model.classes_
-
-        # Format for table
-        prob = survival_prob[0][np.where(classes == vital_status)[0][0]]*100.
-        prob_txt = f'{round(prob, 2)}%'
-        accuracy_txt = f'{round(accuracy, 2)}'
-
-        table = go.Figure(data=[
-            go.Table(
-                header=dict(values=['Vital status', 'Probability', 'Accuracy']),
-                cells=dict(values=[[vital_status], [prob_txt], [accuracy_txt]])
-            )
-        ])
-
-        # Output for UI
-        return html.Div([
-            html.H4('Patient 2-years survival prediction:'),
-            dcc.Graph(figure=table)
-        ],
-            style={
-                'width': '50%', 'display': 'inline-block',
-                'vertical-align': 'middle'
-            }
-        )
-    else:
-        return html.Plaintext('')
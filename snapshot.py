@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+Capture snapshots of the analyses for the offline mode
+
+Run from the repository root with: python snapshot.py
+
+It sends the statistics, similarity and survival tasks with the settings of
+config.py, or reuses their cached results, waits for the results and saves
+them in the snapshot directory. With --refresh the tasks are sent even if
+their results are cached. With --mock the results come from the mock
+vantage6 server of the benchmarks, no collaboration is needed.
+"""
+import time
+import argparse
+
+
+# ------------------------------------------------------------------------------
+# Capture
+# ------------------------------------------------------------------------------
+def capture(timeout, force=False):
+    """ Save the results of every analysis as its snapshot
+    """
+    from pages.home import ANALYSES
+    from utils.poller import poller
+    from utils.snapshots import snapshots
+
+    # Tasks are sent even when the dashboard is configured to run offline
+    snapshots.offline = False
+    states = {}
+    for name, (dispatch, _) in ANALYSES.items():
+        states[name] = {}
+        status, _ = dispatch(states[name], force=force)
+        if status == 'failed':
+            raise RuntimeError(f'Could not send the {name} task')
+        print(f'{name}: {status}')
+
+    deadline = time.time() + timeout
+    while states:
+        for name, state in list(states.items()):
+            result = state.get('result') or poller.result(state['task']['id'])
+            if result is not None:
+                snapshots.save(name, result)
+                print(f'{name}: saved in {snapshots.path}')
+                del states[name]
+        if states and time.time() > deadline:
+            raise TimeoutError(f'No results for {", ".join(states)}')
+        time.sleep(1)
+
+
+# ------------------------------------------------------------------------------
+# Run capture
+# ------------------------------------------------------------------------------
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument(
+        '--mock', action='store_true',
+        help='capture synthetic results of the mock vantage6 server'
+    )
+    args.add_argument(
+        '--refresh', action='store_true',
+        help='send the tasks even if their results are cached'
+    )
+    args.add_argument(
+        '--timeout', type=float, default=60*60,
+        help='seconds to wait for the results'
+    )
+    args = args.parse_args()
+
+    if args.mock:
+        from benchmarks.load import configure
+        from benchmarks.mock_server import MockServer
+
+        with MockServer(latency=0., duration=2.) as server:
+            configure(server, False)
+            capture(args.timeout, args.refresh)
+    else:
+        capture(args.timeout, args.refresh)
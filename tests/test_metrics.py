@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""
+Labels of the callback metrics
+"""
+import dash
+
+from dash import html
+from dash.dependencies import Input
+from dash.dependencies import Output
+
+from utils import metrics
+
+
+# ------------------------------------------------------------------------------
+# Tests
+# ------------------------------------------------------------------------------
+def test_callback_labels():
+    app = dash.Dash(__name__)
+    app.layout = html.Div([html.Button(id='button'), html.Div(id='output')])
+    metrics.register(app)
+
+    @app.callback(Output('output', 'children'), Input('button', 'n_clicks'))
+    def clicks(n_clicks):
+        return n_clicks
+
+    # Outputs that are not a callback of the app share one label
+    client = app.server.test_client()
+    for output in ['output.children', 'made-up.children', 'other.children']:
+        client.post('/_dash-update-component', json={
+            'output': output,
+            'outputs': {'id': 'output', 'property': 'children'},
+            'inputs': [{'id': 'button', 'property': 'n_clicks', 'value': 1}],
+            'changedPropIds': ['button.n_clicks']
+        })
+    labels = {
+        sample.labels['callback']
+        for metric in metrics.callback_seconds.collect()
+        for sample in metric.samples
+    }
+    assert 'output.children' in labels
+    assert 'unknown' in labels
+    assert not labels & {'made-up.children', 'other.children'}
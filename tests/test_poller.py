@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Progress and pruning of the task results shared by the workers
+"""
+import json
+import time
+
+from types import SimpleNamespace
+
+from utils.poller import TaskPoller
+from utils.store import SharedStore
+
+
+# ------------------------------------------------------------------------------
+# vantage6 client
+# ------------------------------------------------------------------------------
+class Cryptor:
+    def decrypt_str_to_bytes(self, value):
+        if value == 'corrupt':
+            raise ValueError('Cannot decrypt')
+        return b'json.' + value.encode()
+
+
+class Client:
+    """ Client of a master task with a subtask that all organisations ran
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.requests = []
+        self.cryptor = Cryptor()
+        self.task = SimpleNamespace(list=lambda **kwargs: [{
+            'id': 2, 'results': [{'id': id_} for id_ in results]
+        }])
+        self.organization = SimpleNamespace(list=lambda **kwargs: [
+            {'id': id_, 'name': f'centre {id_}'} for id_ in results
+        ])
+
+    def request(self, endpoint, params=None):
+        if endpoint == 'result':
+            # No run is still open
+            return []
+        self.requests.append(endpoint)
+        id_ = int(endpoint.split('/')[1])
+        return {
+            'id': id_, 'organization': {'id': id_}, 'started_at': 'start',
+            'finished_at': 'end', 'result': self.results[id_]
+        }
+
+
+# ------------------------------------------------------------------------------
+# Tests
+# ------------------------------------------------------------------------------
+def test_undecodable_result(tmp_path):
+    poller = TaskPoller(SharedStore(str(tmp_path / 'state.sqlite')))
+    client = Client({1: json.dumps({'nids': 10}), 2: 'corrupt'})
+
+    # A result that cannot be decoded fails its organisation, and is not
+    # downloaded again or taken for progress
+    assert poller._progress(client, 1) == (True, False)
+    assert [
+        (centre['name'], centre['status'], centre['result'])
+        for centre in poller.progress(1)
+    ] == [('centre 1', 'done', {'nids': 10}), ('centre 2', 'failed', None)]
+    assert sorted(client.requests) == ['result/1', 'result/2']
+    assert poller._progress(client, 1) == (False, False)
+    assert len(client.requests) == 2
+
+
+def test_undecodable_task(tmp_path, monkeypatch):
+    from utils import poller as module
+
+    poller = TaskPoller(SharedStore(str(tmp_path / 'state.sqlite')))
+    client = SimpleNamespace(
+        cryptor=Cryptor(), requests=[],
+        task=SimpleNamespace(get=lambda task_id: {'complete': True})
+    )
+
+    def request(endpoint, params=None):
+        client.requests.append(endpoint)
+        return [{'id': 1, 'result': 'corrupt'}]
+
+    client.request = request
+    monkeypatch.setattr(module.client_manager, 'session', lambda: client)
+
+    # A complete task without a result that can be decoded has failed, it
+    # is not watched or downloaded anymore
+    poller.watch(1)
+    deadline = time.time() + 10
+    while not poller.failed(1) and time.time() < deadline:
+        time.sleep(.01)
+    assert poller.failed(1)
+    assert poller.result(1) is None
+    assert not poller._tasks
+    assert client.requests == ['result']
+
+
+def test_prune(tmp_path):
+    store = SharedStore(str(tmp_path / 'state.sqlite'))
+    poller = TaskPoller(store)
+    now = time.time()
+    old = now - poller.ttl - 1
+
+    # Tasks 1 and 2 completed, tasks 3 and 4 are still running, of which 3
+    # is not watched anymore
+    for task_id, stored in [(1, old), (2, now)]:
+        store.execute(
+            'INSERT INTO results VALUES (?, ?, ?)', (task_id, b'', stored)
+        )
+    for task_id, expires in [(3, old), (4, now)]:
+        store.execute(
+            'INSERT INTO tasks VALUES (?, ?, ?)', (task_id, 0, expires)
+        )
+    for task_id in range(1, 5):
+        store.execute(
+            'INSERT INTO progress VALUES (?, ?, ?, ?, ?)',
+            (task_id, 1, 'centre', 'done', None)
+        )
+        store.execute('INSERT INTO runs VALUES (?, ?)', (task_id, task_id))
+
+    poller.prune()
+    for table, task_ids in [
+        ('results', {2}), ('tasks', {4}), ('progress', {2, 4}),
+        ('runs', {2, 4})
+    ]:
+        assert {row[0] for row in store.execute(
+            f'SELECT task_id FROM {table}'
+        )} == task_ids
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+"""
+Pooling of the survival curves of the centres
+"""
+import numpy as np
+import pytest
+
+from utils.results import pool_survival
+
+
+CUTOFF = 10
+DELTA = 1
+
+
+# ------------------------------------------------------------------------------
+# Tests
+# ------------------------------------------------------------------------------
+def test_curves_of_different_lengths():
+    results = [
+        # A large centre whose curve stops early, at a high survival rate
+        {'survival': [1., .95, .9], 'nids': 900},
+        {'survival': [1., .8, .7, .6, .5, .4, .3, .2, .1, .05], 'nids': 100},
+        {
+            'survival': [1., .6, .5], 'survival_days': [0, 2, 6],
+            'nids': 100
+        },
+    ]
+    pooled = pool_survival(results, CUTOFF, DELTA)
+    rate = pooled['survival rate'].to_numpy()
+    assert len(pooled) == CUTOFF
+    assert (np.diff(rate) <= 0).all()
+    assert (pooled['patients'] == 1100).all()
+    assert rate[-1] == pytest.approx((900*.9 + 100*.05 + 100*.5)/1100)
+    assert (pooled['lower'] <= rate).all() and (rate <= pooled['upper']).all()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Downloads needed to retrieve the results of a task
+"""
+import time
+
+from benchmarks import load
+from benchmarks.mock_server import MockServer
+from benchmarks.retrieval import previous
+
+
+ORGANIZATIONS = 5
+POLL = .2
+
+
+# ------------------------------------------------------------------------------
+# Tests
+# ------------------------------------------------------------------------------
+def test_retrieval(tmp_path):
+    with MockServer(
+        organizations=ORGANIZATIONS, latency=0., duration=2., queue=.2,
+        survival_points=2000
+    ) as server:
+        load.configure(server, False)
+        from pages import config
+        from utils.client import client_manager
+        from utils.poller import TaskPoller
+        from utils.store import SharedStore
+
+        client = client_manager.session()
+
+        def retrieve(retrieval):
+            task = client.task.create(
+                collaboration=config.collaboration,
+                organizations=config.org_ids, name='retrieval test',
+                image=config.image_stat, description='', input={},
+                data_format='json'
+            )
+            requests, size = server.requests, server.bytes
+            server.downloads.clear()
+            result = retrieval(task['id'])
+            return result, server.requests - requests, server.bytes - size
+
+        # Results downloaded with every status check and again at the end,
+        # as the pages used to
+        result, requests, size = retrieve(
+            lambda task_id: previous(client, task_id, POLL)
+        )
+        assert max(server.downloads.values()) > 1
+
+        # Results of the organisations while the task runs and the result
+        # of the task, each downloaded once
+        poller = TaskPoller(SharedStore(str(tmp_path / 'state.sqlite')))
+        poller.min_delay = poller.max_delay = POLL
+
+        def poller_result(task_id):
+            poller.watch(task_id, partial=True)
+            deadline = time.time() + 30
+            while time.time() < deadline:
+                result = poller.result(task_id)
+                if result is not None:
+                    return result
+                time.sleep(POLL/10)
+
+        polled, polled_requests, polled_size = retrieve(poller_result)
+        assert polled is not None
+        assert [centre['organisation'] for centre in polled['result']] == \
+            [centre['organisation'] for centre in result['result']]
+        assert set(server.downloads.values()) == {1}
+        assert len(server.downloads) == ORGANIZATIONS + 1
+        assert polled_requests < requests
+        assert polled_size < size
+
+
+def test_paged_rows():
+    with MockServer(
+        organizations=ORGANIZATIONS, latency=0., duration=.2, queue=0.
+    ) as server:
+        load.configure(server, False)
+        from pages import config
+        from utils.client import client_manager
+        from utils.decoding import decoder
+
+        # A session of an earlier mock server is of no use
+        client_manager.reset()
+        client = client_manager.session()
+        task = client.task.create(
+            collaboration=config.collaboration, organizations=config.org_ids,
+            name='paging test', image=config.image_stat, description='',
+            input={}, data_format='json'
+        )
+        subtask = client.task.list(parent=task['id'])['data'][0]
+
+        # Rows of all organisations, over pages smaller than the task
+        requests = server.requests
+        rows = decoder.rows(client, subtask['id'], per_page=2)
+        assert len(rows) == ORGANIZATIONS
+        assert len({row['id'] for row in rows}) == ORGANIZATIONS
+        assert server.requests - requests == 3
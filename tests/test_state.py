@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+Concurrent access to the per-session task state
+"""
+import time
+import uuid
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.state import SessionStore
+from utils.store import SharedStore
+
+
+PAGES = ['statistics', 'similarity', 'survival']
+SESSIONS = 8
+UPDATES = 25
+
+
+# ------------------------------------------------------------------------------
+# Sessions
+# ------------------------------------------------------------------------------
+def update(sessions, session_id):
+    # Every session overwrites the same keys of every page, as the pages do
+    # with their task and result, and adds keys of its own
+    for n in range(UPDATES):
+        for page in PAGES:
+            state = sessions.get(session_id, page)
+            state['task'] = {'session': session_id, 'page': page, 'n': n}
+            state[f'run-{n}'] = session_id
+
+
+def update_process(path, session_id):
+    update(SessionStore(SharedStore(path)), session_id)
+
+
+def check(sessions, session_ids):
+    assert len(sessions) == len(session_ids)
+    for session_id in session_ids:
+        for page in PAGES:
+            state = sessions.get(session_id, page)
+            assert dict(state) == {
+                'task': {'session': session_id, 'page': page, 'n': UPDATES - 1},
+                **{f'run-{n}': session_id for n in range(UPDATES)}
+            }
+
+
+# ------------------------------------------------------------------------------
+# Tests
+# ------------------------------------------------------------------------------
+def test_threads(tmp_path):
+    sessions = SessionStore(SharedStore(str(tmp_path / 'state.sqlite')))
+    session_ids = [str(uuid.uuid4()) for _ in range(SESSIONS)]
+    with ThreadPoolExecutor(max_workers=SESSIONS) as pool:
+        for future in [
+            pool.submit(update, sessions, session_id)
+            for session_id in session_ids
+        ]:
+            future.result()
+    check(sessions, session_ids)
+
+
+def test_processes(tmp_path):
+    path = str(tmp_path / 'state.sqlite')
+    session_ids = [str(uuid.uuid4()) for _ in range(SESSIONS)]
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=update_process, args=(path, session_id))
+        for session_id in session_ids
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0]*SESSIONS
+    check(SessionStore(SharedStore(path)), session_ids)
+
+
+def test_reads(tmp_path):
+    # Getting the state of a session that was used recently writes nothing
+    sessions = SessionStore(SharedStore(str(tmp_path / 'state.sqlite')))
+    sessions.get('session', 'statistics')['task'] = {'id': 1}
+    connection = sessions.store.connection()
+    changes = connection.total_changes
+    for _ in range(UPDATES):
+        assert sessions.get('session', 'statistics')['task'] == {'id': 1}
+    assert connection.total_changes == changes
+
+
+def test_eviction(tmp_path):
+    sessions = SessionStore(
+        SharedStore(str(tmp_path / 'state.sqlite')), max_sessions=2
+    )
+    sessions.touch_interval = 0.
+    for session_id in ['a', 'b', 'c', 'a']:
+        sessions.get(session_id, 'statistics')['task'] = session_id
+        time.sleep(0.01)
+    sessions.evict()
+    assert len(sessions) == 2
+    assert dict(sessions.get('a', 'statistics')) == {'task': 'a'}
+    assert dict(sessions.get('b', 'statistics')) == {}
+    assert dict(sessions.get('c', 'statistics')) == {'task': 'c'}
+
+    # Sessions idle for longer than the time to live expire
+    sessions.ttl = 0.
+    sessions.evict()
+    assert len(sessions) == 0
+    assert dict(sessions.get('a', 'statistics')) == {}
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed cache of federated results
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+import threading
+
+from collections import OrderedDict
+
+from pages import config
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------------------------------------------------
+# Result cache
+# ------------------------------------------------------------------------------
+class ResultCache:
+    """ Two-tier cache of task results keyed by a hash of the task input
+
+    Results are kept in a small in-memory LRU and written to a directory on
+    disk, so they survive restarts. Entries older than `ttl` seconds are
+    considered stale and are not returned.
+    """
+
+    def __init__(self, path, ttl=24*60*60, max_items=32):
+        self.path = path
+        self.ttl = ttl
+        self.max_items = max_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(image, collaboration, organizations, kwargs):
+        """ Hash of everything that determines the result of a task
+        """
+        content = json.dumps({
+            'image': image,
+            'collaboration': collaboration,
+            'organizations': sorted(organizations),
+            'kwargs': kwargs
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key):
+        """ Return a fresh cached result, or None
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is None:
+            entry = self._read(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None:
+            return None
+        created, value = entry
+        if time.time() - created > self.ttl:
+            self.invalidate(key)
+            return None
+        return value
+
+    def set(self, key, value):
+        """ Store a result in both tiers
+        """
+        entry = (time.time(), value)
+        self._remember(key, entry)
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp = f'{self._file(key)}.{os.getpid()}.' \
+                  f'{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._file(key))
+        except OSError:
+            logger.exception(f'Could not write cached result {key}')
+
+    def invalidate(self, key=None):
+        """ Drop one cached result, or all of them when no key is given
+        """
+        with self._lock:
+            if key is None:
+                self._memory.clear()
+            else:
+                self._memory.pop(key, None)
+        if key is None:
+            files = [
+                os.path.join(self.path, name) for name in self._listdir()
+                if name.endswith('.pkl')
+            ]
+        else:
+            files = [self._file(key)]
+        for file in files:
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def _read(self, key):
+        try:
+            with open(self._file(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception(f'Could not read cached result {key}')
+            return None
+
+    def _listdir(self):
+        try:
+            return os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+
+    def _file(self, key):
+        return os.path.join(self.path, f'{key}.pkl')
+
+
+result_cache = ResultCache(
+    getattr(config, 'cache_dir', os.path.join(os.getcwd(), 'cache')),
+    ttl=getattr(config, 'cache_ttl', 24*60*60)
+)
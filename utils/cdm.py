@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+TNM common data model
+"""
+import os
+import re
+import json
+import functools
+import itertools
+
+
+# ------------------------------------------------------------------------------
+# Load and validate
+# ------------------------------------------------------------------------------
+input_path = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'input'
+)
+cdm_file = os.path.join(input_path, 'cdm.json')
+
+TNM = ('t', 'n', 'm')
+TYPES = ('string', 'categorical')
+
+
+def load(path=cdm_file):
+    """ Load the common data model and check its schema
+    """
+    with open(path) as f:
+        schema = json.load(f)
+
+    for name, field in schema.items():
+        if not isinstance(field, dict) or 'type' not in field:
+            raise ValueError(f'CDM field {name} has no type')
+        if field['type'] not in TYPES:
+            raise ValueError(
+                f'CDM field {name} has unknown type {field["type"]}'
+            )
+        if field['type'] == 'categorical':
+            values = field.get('values')
+            if not values or not isinstance(values, list):
+                raise ValueError(f'CDM field {name} has no values')
+            if len(set(values)) != len(values):
+                raise ValueError(f'CDM field {name} has duplicate values')
+    for name in TNM:
+        if schema.get(name, {}).get('type') != 'categorical':
+            raise ValueError(f'CDM field {name} should be categorical')
+
+    return schema
+
+
+schema = load()
+
+
+# ------------------------------------------------------------------------------
+# Encoders
+# ------------------------------------------------------------------------------
+def _code(name, index, value):
+    # TNM stages are encoded by their number, e.g. T2a is 2 and Tx is -1,
+    # other categorical fields by their position in the CDM
+    if name in TNM:
+        digits = re.compile(r'\d').findall(value)
+        return int(digits[0]) if len(digits) != 0 else -1
+    return index
+
+
+@functools.lru_cache(maxsize=None)
+def encoder(name):
+    """ Encode and decode tables of a categorical field, built on first use
+
+    Returns the categories in sorted order with their codes, for lookups
+    with a binary search, and the categories in CDM order with their codes.
+    """
+    import numpy as np
+
+    categories = np.array(values(name))
+    codes = np.array([
+        _code(name, index, value) for index, value in enumerate(categories)
+    ])
+    order = np.argsort(categories)
+    return categories[order], codes[order], categories, codes
+
+
+def values(name):
+    """ Categories of a field, in the order of the CDM
+    """
+    return schema[name]['values']
+
+
+def encode(name, data):
+    """ Encode an array of categories of a field to numeric codes
+
+    Unknown categories are encoded as -1.
+    """
+    import numpy as np
+
+    keys, codes, _, _ = encoder(name)
+    data = np.asarray(data, dtype=str)
+    position = np.searchsorted(keys, data).clip(max=len(keys) - 1)
+    return np.where(keys[position] == data, codes[position], -1)
+
+
+def decode(name, data):
+    """ Decode an array of numeric codes of a field to categories
+
+    Codes shared by several categories, such as the 2 of T2a and T2b,
+    decode to the first of them in the CDM. Unknown codes decode to None.
+    """
+    import numpy as np
+
+    _, _, categories, codes = encoder(name)
+    data = np.asarray(data)
+    match = codes == data[..., np.newaxis]
+    found = match.any(axis=-1)
+    return np.where(found, categories[np.argmax(match, axis=-1)], None)
+
+
+def encode_patients(patients, columns=TNM):
+    """ Encode the TNM stages of many patients at once
+
+    The patients can be any mapping of columns, like a DataFrame, and the
+    result is an array with one row per patient and one column per field.
+    """
+    import numpy as np
+
+    return np.column_stack([encode(name, patients[name]) for name in columns])
+
+
+# ------------------------------------------------------------------------------
+# TNM grid
+# ------------------------------------------------------------------------------
+combinations = list(itertools.product(*(values(name) for name in TNM)))
+
+
+@functools.lru_cache(maxsize=None)
+def grid():
+    """ Encoded TNM stages of all combinations, one row per combination
+    """
+    import numpy as np
+
+    grid = np.column_stack([
+        encode(name, [xi[i] for xi in combinations])
+        for i, name in enumerate(TNM)
+    ])
+    grid.flags.writeable = False
+    return grid
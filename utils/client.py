@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared vantage6 client session
+"""
+import time
+import logging
+import threading
+
+from pathlib import Path
+
+from pages import config
+from utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------------------------------------------------
+# Client manager
+# ------------------------------------------------------------------------------
+class ClientManager:
+    """ Process-wide vantage6 client that authenticates only once
+
+    The first call to `get` builds the client, authenticates and sets up the
+    encryption. Later calls hand out the same warm session, while a
+    background thread refreshes the access token before it expires.
+
+    A job process continues the session of its worker, or hands the session
+    it created over to the worker, see `handover` and `resume`. Its
+    dispatches are kept in `accounts` and counted by the worker.
+    """
+
+    # Refresh the token this many seconds before it expires
+    refresh_margin = 60
+    # Fallback token lifetime when the token carries no expiry claim
+    default_lifetime = 15*60
+
+    def __init__(self):
+        self.client = None
+        self.expires_at = None
+        self.setup_time = None
+        self.saved_time = 0.
+        self.dispatches = 0
+        self.accounts = None
+        self._lock = threading.RLock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def session(self):
+        """ Return the shared client, creating it on first use
+        """
+        with self._lock:
+            if self.client is None or self._expired():
+                self._connect()
+            return self.client
+
+    def get(self):
+        """ Return the shared client for a task dispatch
+
+        Besides the client, it returns the number of seconds saved by not
+        having to authenticate and set up the encryption again.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            reused = self.client is not None and not self._expired()
+            client = self.session()
+        saved = self.setup_time - (time.perf_counter() - start) if reused \
+            else 0.
+        self.account(reused, saved)
+        return client, saved
+
+    def account(self, reused, saved):
+        """ Count a dispatch and the seconds saved by reusing the session
+
+        In a job process the dispatch is kept in `accounts` for the worker.
+        """
+        if self.accounts is not None:
+            self.accounts.append((reused, saved))
+            return
+        with self._lock:
+            self.dispatches += 1
+            if reused:
+                self.saved_time += saved
+        if reused:
+            logger.info(
+                f'Reused vantage6 session, saved {saved:.3f} seconds '
+                f'({self.saved_time:.3f} seconds over {self.dispatches} '
+                f'dispatches)'
+            )
+
+    def handover(self):
+        """ Session to continue in another process, or None
+
+        A job continues the session of its worker, and a worker the session
+        that a job created, with its access token until it expires, so they
+        do not authenticate again.
+        """
+        client, expires_at = self.client, self.expires_at
+        if client is None or self._expired():
+            return None
+        return {
+            'token': client.token, 'whoami': client.whoami,
+            'expires_at': expires_at, 'setup_time': self.setup_time
+        }
+
+    def resume(self, session):
+        """ Continue a session of `handover`, unless this one is live
+        """
+        if session is None or session['expires_at'] <= time.time():
+            return
+        with self._lock:
+            if self.client is not None and not self._expired():
+                return
+        from vantage6.client import Client
+        from vantage6.common.encryption import DummyCryptor
+        from vantage6.common.encryption import RSACryptor
+
+        client = metrics.instrument(Client(
+            config.server_url, config.server_port, config.server_api,
+            verbose=True
+        ))
+        # The client has no public way to set the token of a session
+        client._access_token = session['token']
+        client.whoami = session['whoami']
+        client.cryptor = RSACryptor(Path(config.privkey_path)) \
+            if config.privkey_path else DummyCryptor()
+        with self._lock:
+            self.client = client
+            self.expires_at = session['expires_at']
+            self.setup_time = session['setup_time']
+
+    def reset(self):
+        """ Drop the current session, the next call re-authenticates
+        """
+        with self._lock:
+            self.client = None
+            self.expires_at = None
+            self._stop.set()
+
+    def _connect(self):
+        from vantage6.client import Client
+
+        start = time.perf_counter()
+        client = metrics.instrument(Client(
+            config.server_url, config.server_port, config.server_api,
+            verbose=True
+        ))
+        client.authenticate(config.username, config.password)
+        client.setup_encryption(config.privkey_path)
+        self.setup_time = time.perf_counter() - start
+        self.client = client
+        self.expires_at = self._token_expiry(client.token)
+        logger.info(
+            f'Authenticated to vantage6 in {self.setup_time:.3f} seconds'
+        )
+        self._start_refresher()
+
+    def _expired(self):
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def _token_expiry(self, token):
+        import jwt
+
+        try:
+            claims = jwt.decode(token, options={'verify_signature': False})
+            return float(claims['exp'])
+        except Exception:
+            return time.time() + self.default_lifetime
+
+    def _start_refresher(self):
+        self._stop.set()
+        self._stop = threading.Event()
+        self._refresher = threading.Thread(
+            target=self._refresh_loop, args=(self._stop,),
+            name='vantage6-token-refresh', daemon=True
+        )
+        self._refresher.start()
+
+    def _refresh_loop(self, stop):
+        while True:
+            with self._lock:
+                if stop.is_set():
+                    return
+                delay = self.expires_at - self.refresh_margin - time.time()
+            if stop.wait(max(delay, 1)):
+                return
+            with self._lock:
+                if stop.is_set():
+                    return
+                try:
+                    self.client.refresh_token()
+                    self.expires_at = self._token_expiry(self.client.token)
+                    logger.info('Refreshed vantage6 access token')
+                except Exception:
+                    # Refresh token is no longer valid, authenticate again
+                    logger.warning('Token refresh failed, re-authenticating')
+                    self._connect()
+                    return
+
+
+client_manager = ClientManager()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parallel decryption and decoding of vantage6 results
+"""
+import os
+import time
+import logging
+import threading
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+
+from pages import config
+from utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Cryptor of a worker process
+_cryptor = None
+
+
+# ------------------------------------------------------------------------------
+# Worker processes
+# ------------------------------------------------------------------------------
+def _init_worker(privkey_path):
+    from pathlib import Path
+
+    from vantage6.common.encryption import DummyCryptor
+    from vantage6.common.encryption import RSACryptor
+
+    global _cryptor
+    _cryptor = RSACryptor(Path(privkey_path)) if privkey_path \
+        else DummyCryptor()
+    # The cryptor logs every shared key it decrypts
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def _decode_worker(payload):
+    return _decode(_cryptor, payload, parse=True)
+
+
+def _decode(cryptor, payload, parse):
+    # Decrypted JSON is parsed in the worker, while pickled data is sent back
+    # as bytes, to avoid unpickling and pickling it again for the transfer
+    data = cryptor.decrypt_str_to_bytes(payload)
+    if parse and not data.startswith(b'json.'):
+        return data, False
+    from vantage6.client.deserialization import load_data
+    return load_data(data), True
+
+
+# ------------------------------------------------------------------------------
+# Result decoder
+# ------------------------------------------------------------------------------
+class ResultDecoder:
+    """ Decrypts and deserializes result rows in a pool of processes
+
+    The vantage6 client decrypts every result row, and its input, one after
+    the other in the calling thread. Here only the results are decrypted,
+    and when there are several rows of at least `min_bytes` in total, they
+    are spread over `workers` processes, by default one per CPU. Rows are
+    handed back as soon as they are decoded.
+    """
+
+    min_bytes = 256*1024
+
+    def __init__(self, privkey_path=None, workers=None):
+        self.privkey_path = privkey_path
+        self.workers = workers or min(os.cpu_count() or 1, 8)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def list(self, client, task_id):
+        """ Results of a task, like `client.result.list(task=task_id)`
+
+        Returns the rows in the order of the server, rows that cannot be
+        decoded are left out.
+        """
+        rows = self.rows(client, task_id)
+        decoded = dict(self.decode(client, rows))
+        return [decoded[i] for i in range(len(rows)) if i in decoded]
+
+    @staticmethod
+    def rows(client, task_id, per_page=100, **params):
+        """ Result rows of a task as sent by the server, still encrypted
+
+        Extra `params` filter the rows, such as `state='open'` for the rows
+        that are not finished. The rows are requested `per_page` at a time,
+        following the pagination links of the server.
+        """
+        rows, page = [], 1
+        while True:
+            response = client.request('result', params={
+                'task_id': task_id, **params, 'page': page,
+                'per_page': per_page, 'include': 'metadata'
+            })
+            if not isinstance(response, dict):
+                # Without pagination metadata the server sent all rows
+                return rows + response
+            rows.extend(response.get('data', []))
+            if not (response.get('links') or {}).get('next'):
+                return rows
+            page += 1
+
+    @staticmethod
+    def fetch(client, result_ids, threads=8):
+        """ Result rows by id, still encrypted, requested concurrently
+        """
+        if len(result_ids) <= 1:
+            return [client.request(f'result/{id_}') for id_ in result_ids]
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(
+                lambda id_: client.request(f'result/{id_}'), result_ids
+            ))
+
+    def decode(self, client, rows):
+        """ Decode result rows, yielding their index and row when done
+        """
+        start = time.perf_counter()
+        pending = [i for i, row in enumerate(rows) if row.get('result')]
+        for i, row in enumerate(rows):
+            if not row.get('result'):
+                yield i, row
+        size = sum(len(rows[i]['result']) for i in pending)
+
+        if self.workers > 1 and len(pending) > 1 and size >= self.min_bytes:
+            pool = self._executor()
+            futures = {
+                pool.submit(_decode_worker, rows[i]['result']): i
+                for i in pending
+            }
+            decoded = (
+                (futures[future], future) for future in as_completed(futures)
+            )
+        else:
+            decoded = (
+                (i, rows[i]['result']) for i in pending
+            )
+
+        for i, value in decoded:
+            try:
+                if isinstance(value, str):
+                    value, parsed = _decode(client.cryptor, value, parse=False)
+                else:
+                    value, parsed = value.result()
+                if not parsed:
+                    from vantage6.client.deserialization import load_data
+                    value = load_data(value)
+            except Exception:
+                logger.exception(f'Could not decode result id={rows[i]["id"]}')
+                continue
+            yield i, {**rows[i], 'result': value}
+        metrics.vantage6_seconds.labels('decrypt').observe(
+            time.perf_counter() - start
+        )
+
+    def _executor(self):
+        # Spawned processes, forking a process with running threads is unsafe
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=(self.privkey_path,)
+                )
+            return self._pool
+
+
+decoder = ResultDecoder(
+    config.privkey_path, getattr(config, 'decode_workers', None)
+)
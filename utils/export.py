@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""
+Streaming export of the tables behind the pages
+"""
+import io
+import json
+import hashlib
+
+from flask import Response
+from flask import abort
+from flask import request
+from flask import stream_with_context
+
+
+FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Rows serialized at once, every chunk is sent before the next is built
+CHUNK_ROWS = 10000
+
+
+# ------------------------------------------------------------------------------
+# Chunks
+# ------------------------------------------------------------------------------
+def csv_chunks(df, rows=CHUNK_ROWS):
+    """ CSV of a DataFrame, header first and then `rows` rows at a time
+    """
+    yield df.iloc[:0].to_csv(index=False)
+    for start in range(0, len(df), rows):
+        yield df.iloc[start:start + rows].to_csv(index=False, header=False)
+
+
+def parquet_chunks(df, rows=CHUNK_ROWS):
+    """ Parquet file of a DataFrame, one row group of `rows` rows at a time
+
+    Needs pyarrow, which is not a requirement of the dashboard.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _Sink()
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(sink, schema) as writer:
+        for start in range(0, len(df), rows):
+            writer.write_table(pa.Table.from_pandas(
+                df.iloc[start:start + rows], schema=schema,
+                preserve_index=False
+            ))
+            yield sink.drain()
+    yield sink.drain()
+
+
+class _Sink(io.RawIOBase):
+    # Output stream that hands over what was written since the last drain,
+    # while keeping the offsets the Parquet footer refers to
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+# ------------------------------------------------------------------------------
+# Export route
+# ------------------------------------------------------------------------------
+def register(server, sources):
+    """ Serve the tables of the cached results
+
+    The tables are on /export/<analysis>/<table>.<csv|parquet>, `sources`
+    maps every analysis to a function that returns its cached result, or
+    None, and a function that returns the tables of a result by name.
+
+    Responses carry an ETag of the result, table and format, so repeated
+    downloads of an unchanged result are answered with a 304 before any
+    table is built.
+    """
+    @server.route('/export/<analysis>/<table>.<fmt>')
+    def export(analysis, table, fmt):
+        if analysis not in sources or fmt not in FORMATS:
+            abort(404)
+        cached_result, tables = sources[analysis]
+        result_info = cached_result()
+        if not result_info:
+            abort(404, description=f'No results of {analysis} yet')
+
+        etag = hashlib.sha256(json.dumps([
+            analysis, table, fmt, result_info['task']['id'],
+            result_info['finished_at']
+        ], default=str).encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        df = tables(result_info).get(table)
+        if df is None:
+            abort(404, description=f'No table {table} in {analysis}')
+        if fmt == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                abort(501, description='Parquet export needs pyarrow')
+            chunks = parquet_chunks(df)
+        else:
+            chunks = csv_chunks(df)
+
+        response = Response(
+            stream_with_context(chunks), mimetype=FORMATS[fmt]
+        )
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Content-Disposition'] = \
+            f'attachment; filename={analysis}-{table}.{fmt}'
+        return response
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compact plotly figures
+"""
+import os
+import re
+import base64
+import functools
+
+import dash
+
+
+# plotly.js decodes binary typed arrays since this version
+TYPED_ARRAYS_SINCE = (2, 28, 0)
+
+# Layout and trace defaults of the plotly template kept in the slim template
+TEMPLATE_LAYOUT = [
+    'autotypenumbers', 'colorway', 'font', 'hovermode', 'hoverlabel',
+    'paper_bgcolor', 'plot_bgcolor', 'coloraxis', 'colorscale', 'xaxis',
+    'yaxis', 'title'
+]
+TEMPLATE_DATA = ['bar', 'scatter', 'heatmap']
+
+# Trace attributes equal to the plotly.js defaults, which can be left out
+TRACE_DEFAULTS = {
+    'xaxis': 'x', 'yaxis': 'y', 'showlegend': True, 'textposition': 'auto',
+    'orientation': 'v', 'legendgroup': '',
+    'marker': {'pattern': {'shape': ''}, 'symbol': 'circle'},
+    'line': {'dash': 'solid'}
+}
+
+# Typed arrays, the smallest integer type that fits the values is used
+DTYPES = {'float32': 'f4', 'int8': 'i1', 'int16': 'i2', 'int32': 'i4'}
+
+
+# ------------------------------------------------------------------------------
+# Environment
+# ------------------------------------------------------------------------------
+@functools.lru_cache(maxsize=None)
+def plotlyjs_version():
+    """ Version of the plotly.js bundle served by dash
+    """
+    path = os.path.join(os.path.dirname(dash.__file__), 'dcc', 'plotly.min.js')
+    with open(path) as f:
+        match = re.search(r'plotly\.js v(\d+)\.(\d+)\.(\d+)', f.read(500))
+    return tuple(int(v) for v in match.groups()) if match else (0, 0, 0)
+
+
+def typed_arrays():
+    """ Whether the browser can decode binary typed arrays
+    """
+    return plotlyjs_version() >= TYPED_ARRAYS_SINCE
+
+
+@functools.lru_cache(maxsize=None)
+def template():
+    """ Slim copy of the plotly template, shared by all figures
+
+    Only the layout and traces of 2D cartesian charts are kept, the default
+    template also styles maps, 3D scenes and polar charts.
+    """
+    import plotly.io as pio
+
+    default = pio.templates['plotly'].to_plotly_json()
+    return {
+        'layout': {
+            key: value for key, value in default['layout'].items()
+            if key in TEMPLATE_LAYOUT
+        },
+        'data': {
+            key: value for key, value in default['data'].items()
+            if key in TEMPLATE_DATA
+        }
+    }
+
+
+# ------------------------------------------------------------------------------
+# Compact figures
+# ------------------------------------------------------------------------------
+def compact(figure, max_points=None, precision=4, binary=None):
+    """ Serializable figure with a minimal payload
+
+    The shared slim template replaces the default one, attributes equal to
+    their defaults are dropped and numeric arrays are sent as binary typed
+    arrays when the browser supports them, otherwise as lists of numbers
+    rounded to `precision` decimals; `binary` overrides this choice. Line
+    traces longer than `max_points` are down-sampled, keeping their first
+    and last points.
+    """
+    if not isinstance(figure, dict):
+        figure = figure.to_dict()
+    if binary is None:
+        binary = typed_arrays()
+
+    colorway = template()['layout']['colorway']
+    data = []
+    for i, trace in enumerate(figure.get('data', [])):
+        # Colors of the colorway are the default of the n-th trace
+        default = colorway[i % len(colorway)]
+        trace = _strip(trace, {
+            **TRACE_DEFAULTS,
+            'marker': {**TRACE_DEFAULTS['marker'], 'color': default},
+            'line': {**TRACE_DEFAULTS['line'], 'color': default}
+        })
+        if max_points and trace.get('mode') == 'lines':
+            _downsample(trace, max_points)
+        for key, value in trace.items():
+            trace[key] = _array(value, binary, precision)
+        data.append(trace)
+
+    layout = dict(figure.get('layout', {}))
+    layout['template'] = template()
+    return {'data': data, 'layout': layout}
+
+
+def _strip(values, defaults):
+    # Drop the attributes equal to their default, recursively
+    stripped = {}
+    for key, value in values.items():
+        default = defaults.get(key, ...)
+        if isinstance(value, dict) and isinstance(default, dict):
+            value = _strip(value, default)
+            if not value:
+                continue
+        elif isinstance(default, (str, bool)) and \
+                isinstance(value, (str, bool)) and value == default:
+            continue
+        stripped[key] = value
+    return stripped
+
+
+def _downsample(trace, max_points):
+    import numpy as np
+
+    x = _numpy(trace.get('x'))
+    y = _numpy(trace.get('y'))
+    if x is None or y is None or len(y) <= max_points:
+        return
+    keep = np.linspace(0, len(y) - 1, max_points).round().astype(int)
+    keep = np.unique(keep)
+    trace['x'] = x[keep]
+    trace['y'] = y[keep]
+
+
+def _numpy(value):
+    # Numeric arrays of a figure, as lists, arrays or typed array specs
+    import numpy as np
+
+    if isinstance(value, dict) and 'bdata' in value:
+        array = np.frombuffer(
+            base64.b64decode(value['bdata']), dtype=value['dtype']
+        )
+        if 'shape' in value:
+            shape = str(value['shape']).split(',')
+            array = array.reshape([int(n) for n in shape if n.strip()])
+        return array
+    if isinstance(value, np.ndarray):
+        return value if value.dtype.kind in 'iuf' else None
+    if isinstance(value, (list, tuple)) and value and all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in value
+    ):
+        return np.asarray(value)
+    return None
+
+
+def _array(value, binary, precision):
+    import numpy as np
+
+    array = _numpy(value)
+    if array is None or array.ndim == 0 or array.size == 0:
+        return value
+    if array.dtype.kind == 'f':
+        if np.array_equal(array, array.round()) and \
+                np.abs(array).max() < 2**31:
+            array = array.astype('int32')
+        else:
+            array = array.round(precision)
+    if not binary:
+        return array.tolist()
+
+    if array.dtype.kind == 'f':
+        dtype = 'float32'
+    else:
+        dtype = next((
+            dtype for dtype in ['int8', 'int16', 'int32']
+            if np.iinfo(dtype).min <= array.min() <= array.max() <=
+            np.iinfo(dtype).max
+        ), None)
+        if dtype is None:
+            return array.tolist()
+    array = array.astype(dtype)
+    spec = {
+        'dtype': DTYPES[array.dtype.name],
+        'bdata': base64.b64encode(
+            np.ascontiguousarray(array).tobytes()
+        ).decode('ascii')
+    }
+    if array.ndim > 1:
+        spec['shape'] = ', '.join(str(n) for n in array.shape)
+    return spec
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+Columnar history of completed federated runs
+"""
+import os
+import json
+import time
+import logging
+
+from pages import config
+from utils.store import shared_store
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------------------------------------------------
+# History
+# ------------------------------------------------------------------------------
+class History:
+    """ Append-only history of the results of every completed task
+
+    Results are flattened to rows of centre, series, x and value, and the
+    rows are appended to one binary file per column, which are read back
+    as memory maps. A run occupies a contiguous range of rows, recorded in
+    the shared store with the labels of its centres and series, so loading
+    a few runs only touches their part of the files.
+
+    Appends are serialized over all worker processes by a write transaction
+    of the shared store.
+    """
+
+    COLUMNS = {
+        'centre': 'int32', 'series': 'int32', 'x': 'float64',
+        'value': 'float64'
+    }
+
+    def __init__(self, path, store):
+        self.path = path
+        self.store = store
+        store.schema("""
+            CREATE TABLE IF NOT EXISTS history_runs (
+                run INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id INTEGER UNIQUE, analysis TEXT, finished_at TEXT,
+                recorded REAL, start INTEGER, stop INTEGER, series TEXT
+            );
+            CREATE TABLE IF NOT EXISTS history_labels (
+                code INTEGER PRIMARY KEY, label TEXT UNIQUE
+            );
+        """)
+
+    def record(self, task_id, analysis, finished_at, records):
+        """ Append the results of a task, unless they are already recorded
+
+        `records` are tuples of centre, series, x values and values, x and
+        values being scalars or arrays of the same length.
+        """
+        import numpy as np
+
+        if self.store.execute(
+            'SELECT 1 FROM history_runs WHERE task_id = ?', (task_id,)
+        ).fetchone() is not None:
+            return
+
+        centres, series, x, value = [], [], [], []
+        for centre, name, xs, values in records:
+            xs, values = np.broadcast_arrays(
+                np.asarray(xs, dtype=float), np.asarray(values, dtype=float)
+            )
+            centres.extend([centre]*values.size)
+            series.extend([name]*values.size)
+            x.append(xs.ravel())
+            value.append(values.ravel())
+        if not value:
+            return
+
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with self.store.transaction() as db:
+                if db.execute(
+                    'SELECT 1 FROM history_runs WHERE task_id = ?',
+                    (task_id,)
+                ).fetchone() is not None:
+                    return
+                db.executemany(
+                    'INSERT OR IGNORE INTO history_labels (label) VALUES (?)',
+                    [(label,) for label in set(centres) | set(series)]
+                )
+                codes = dict(db.execute(
+                    'SELECT label, code FROM history_labels'
+                ).fetchall())
+                start = db.execute(
+                    'SELECT COALESCE(MAX(stop), 0) FROM history_runs'
+                ).fetchone()[0]
+                columns = {
+                    'centre': [codes[centre] for centre in centres],
+                    'series': [codes[name] for name in series],
+                    'x': np.concatenate(x),
+                    'value': np.concatenate(value),
+                }
+                for name, data in columns.items():
+                    self._append(name, start, data)
+                db.execute(
+                    'INSERT INTO history_runs (task_id, analysis, '
+                    'finished_at, recorded, start, stop, series) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (task_id, analysis, str(finished_at), time.time(), start,
+                     start + len(columns['value']),
+                     json.dumps(sorted(set(series))))
+                )
+        except OSError:
+            logger.exception(f'Could not record the history of task {task_id}')
+
+    def runs(self, analysis):
+        """ Recorded runs of an analysis, the latest first
+        """
+        rows = self.store.execute(
+            'SELECT run, task_id, finished_at, series FROM history_runs '
+            'WHERE analysis = ? ORDER BY run DESC', (analysis,)
+        ).fetchall()
+        return [
+            {
+                'run': run, 'task_id': task_id, 'finished_at': finished_at,
+                'series': json.loads(series)
+            }
+            for run, task_id, finished_at, series in rows
+        ]
+
+    def load(self, runs, series):
+        """ Rows of one series in some runs, as a DataFrame
+
+        Only the rows of the requested runs are read from the memory maps,
+        and only those of the series are copied into the DataFrame.
+        """
+        import numpy as np
+        import pandas as pd
+
+        frames = {'run': [], 'centre': [], 'x': [], 'value': []}
+        code = self.store.execute(
+            'SELECT code FROM history_labels WHERE label = ?', (series,)
+        ).fetchone()
+        ranges = self.store.execute(
+            'SELECT run, start, stop FROM history_runs WHERE run IN '
+            f'({", ".join("?"*len(runs))}) ORDER BY run', list(runs)
+        ).fetchall() if runs else []
+        if code is None or not ranges:
+            return pd.DataFrame({name: [] for name in frames})
+
+        maps = {
+            name: self._map(name, max(stop for _, _, stop in ranges))
+            for name in self.COLUMNS
+        }
+        for run, start, stop in ranges:
+            rows = np.flatnonzero(maps['series'][start:stop] == code[0])
+            frames['run'].append(np.full(len(rows), run))
+            for name in ('centre', 'x', 'value'):
+                frames[name].append(np.array(maps[name][start:stop][rows]))
+
+        labels = dict(self.store.execute(
+            'SELECT code, label FROM history_labels'
+        ).fetchall())
+        df = pd.DataFrame({
+            name: np.concatenate(columns) for name, columns in frames.items()
+        })
+        df['centre'] = df['centre'].map(labels)
+        return df
+
+    def _file(self, name):
+        return os.path.join(self.path, f'{name}.{self.COLUMNS[name]}')
+
+    def _append(self, name, start, data):
+        import numpy as np
+
+        # Rows beyond the last recorded run come from an interrupted append
+        data = np.asarray(data, dtype=self.COLUMNS[name])
+        with open(self._file(name), 'ab') as f:
+            f.truncate(start*data.itemsize)
+            f.write(data.tobytes())
+
+    def _map(self, name, rows):
+        import numpy as np
+
+        return np.memmap(
+            self._file(name), dtype=self.COLUMNS[name], mode='r',
+            shape=(rows,)
+        )
+
+
+history = History(
+    getattr(config, 'history_dir', None) or os.path.join(
+        getattr(config, 'cache_dir', os.path.join(os.getcwd(), 'cache')),
+        'history'
+    ),
+    shared_store
+)
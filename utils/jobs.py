@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+Job processes of the long callbacks
+"""
+import os
+import types
+import functools
+import importlib
+
+from dash.long_callback import DiskcacheLongCallbackManager
+
+from pages import config
+
+
+# Third-party modules the fork server imports once for all jobs, the modules
+# of the dashboard depend on the settings and are imported by every job
+PRELOAD = [
+    'dash', 'dash_bootstrap_components', 'dateutil.parser', 'diskcache',
+    'vantage6.client'
+]
+
+# Job functions of the long callbacks, by module and name
+_jobs = {}
+
+# Key of the long callback that the job process runs
+_key = None
+
+
+# ------------------------------------------------------------------------------
+# Job manager
+# ------------------------------------------------------------------------------
+class JobManager(DiskcacheLongCallbackManager):
+    """ Long callback manager that starts its jobs in clean processes
+
+    The disk cache manager forks the worker to run a job, with the locks
+    that the other threads of the worker, such as the SQLite mutexes, hold
+    at that moment, so the job can deadlock. Jobs are started from a fork
+    server instead, a single-threaded process that only imported the
+    `PRELOAD` modules. Every job takes over the settings of the worker and
+    its vantage6 session, and imports the callback it runs.
+
+    Before its output, a job leaves a report of what it did in the worker's
+    stead, such as its vantage6 calls, which the worker that collects the
+    output takes over, see `report` and `take_over`.
+    """
+
+    def __init__(self, cache, method='forkserver'):
+        import multiprocess
+
+        super().__init__(cache)
+        if method not in multiprocess.get_all_start_methods():
+            method = 'spawn'
+        self.context = multiprocess.get_context(method)
+        if method == 'forkserver':
+            self.context.set_forkserver_preload(PRELOAD)
+
+    def make_job_fn(self, fn, progress, args_deps):
+        handle = self.handle
+
+        @functools.wraps(fn)
+        def reported(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                handle.set(f'{_key}-report', report())
+
+        name = f'{fn.__module__}.{fn.__qualname__}'
+        _jobs[name] = super().make_job_fn(reported, progress, args_deps)
+        return name
+
+    def call_job_fn(self, key, job_fn, args):
+        from utils.client import client_manager
+
+        process = self.context.Process(target=run, args=(
+            job_fn, key, self._make_progress_key(key), args, settings(),
+            client_manager.handover()
+        ))
+        process.start()
+        return process.pid
+
+    def get_result(self, key, job):
+        take_over(self.handle.pop(f'{key}-report', None))
+        return super().get_result(key, job)
+
+    def clear_cache_entry(self, key):
+        self.handle.delete(f'{key}-report')
+        super().clear_cache_entry(key)
+
+
+def settings():
+    """ Settings of config.py, as the worker uses them
+    """
+    return {
+        name: value for name, value in vars(config).items()
+        if not name.startswith('__') and
+        not isinstance(value, types.ModuleType)
+    }
+
+
+def report():
+    """ What a job did for its worker, in the job process
+    """
+    from utils import metrics
+
+    from utils.client import client_manager
+
+    return {
+        'calls': metrics.recorded, 'dispatches': client_manager.accounts,
+        'session': client_manager.handover()
+    }
+
+
+def take_over(report):
+    """ Take over the report of a job, in the worker
+    """
+    if report is None:
+        return
+    from utils import metrics
+    from utils.client import client_manager
+
+    for call in report['calls']:
+        metrics.observe_call(*call)
+    for dispatch in report['dispatches']:
+        client_manager.account(*dispatch)
+    client_manager.resume(report['session'])
+
+
+def run(name, key, progress_key, args, settings, session):
+    """ Run the job of a long callback in a job process
+    """
+    # Metrics are recorded by the workers, a job leaves no files in the
+    # multiprocess directory behind and reports its vantage6 calls instead
+    global _key
+    _key = key
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    vars(config).update(settings)
+
+    from utils import metrics
+    from utils.client import client_manager
+
+    metrics.recorded = []
+    client_manager.accounts = []
+    client_manager.resume(session)
+    importlib.import_module(name.rsplit('.', 1)[0])
+    _jobs[name](key, progress_key, args)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""
+Prometheus metrics of the dashboard
+"""
+import os
+import time
+import functools
+
+from flask import Response
+from flask import g
+from flask import request
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import REGISTRY
+from prometheus_client import generate_latest
+from prometheus_client import multiprocess
+
+
+# From milliseconds for callbacks up to an hour for federated tasks
+BUCKETS = (
+    .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60., 120., 300.,
+    600., 1800., 3600., float('inf')
+)
+
+callback_seconds = Histogram(
+    'healthai_callback_seconds', 'Duration of the Dash callbacks',
+    ['callback'], buckets=BUCKETS
+)
+callback_errors = Counter(
+    'healthai_callback_errors_total', 'Dash callbacks that failed',
+    ['callback']
+)
+vantage6_seconds = Histogram(
+    'healthai_vantage6_seconds', 'Duration of the vantage6 client calls',
+    ['call'], buckets=BUCKETS
+)
+vantage6_errors = Counter(
+    'healthai_vantage6_errors_total', 'vantage6 client calls that failed',
+    ['call']
+)
+task_seconds = Histogram(
+    'healthai_task_phase_seconds',
+    'Round trip of the vantage6 tasks: queueing at the nodes, federated '
+    'compute, polling delay and download of the results',
+    ['phase'], buckets=BUCKETS
+)
+render_cache = Counter(
+    'healthai_render_cache_total', 'Lookups in the cache of rendered outputs',
+    ['result']
+)
+
+# vantage6 calls of a job process, as arguments of `observe_call`, which
+# its worker records instead, see utils/jobs.py
+recorded = None
+
+# Client methods that are timed, with their metric label
+VANTAGE6_CALLS = [
+    ('', 'authenticate', 'authenticate'),
+    ('', 'setup_encryption', 'setup_encryption'),
+    ('', 'refresh_token', 'refresh_token'),
+    ('', 'request', 'request'),
+    ('', '_decrypt_result', 'decrypt'),
+    ('task', 'create', 'task.create'),
+    ('task', 'get', 'task.get'),
+    ('result', 'list', 'result.list'),
+]
+
+
+# ------------------------------------------------------------------------------
+# vantage6 client
+# ------------------------------------------------------------------------------
+def timed(function, call):
+    """ Wrap a function to time its calls as a vantage6 call
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        failed = False
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            observe_call(call, time.perf_counter() - start, failed)
+    return wrapper
+
+
+def observe_call(call, seconds, failed=False):
+    """ Record the duration of a vantage6 call, and whether it failed
+
+    In a job process the call is kept in `recorded` for the worker.
+    """
+    if recorded is not None:
+        recorded.append((call, seconds, failed))
+        return
+    if failed:
+        vantage6_errors.labels(call).inc()
+    vantage6_seconds.labels(call).observe(seconds)
+
+
+def instrument(client):
+    """ Time the calls of a vantage6 client to the server
+
+    The HTTP requests and the decryption of the results are timed as well,
+    so the time of a call can be split into download and decryption.
+    """
+    for owner, name, call in VANTAGE6_CALLS:
+        owner = getattr(client, owner) if owner else client
+        setattr(owner, name, timed(getattr(owner, name), call))
+    return client
+
+
+def observe_task(watched, detected, downloaded, result):
+    """ Split the round trip of a completed task into its phases
+
+    `watched` is when the dashboard started watching the task, `detected`
+    when it found the task complete and `downloaded` when the results were
+    retrieved. The start and end of the computation come from the result.
+    """
+    from dateutil import parser
+
+    try:
+        started = parser.parse(result['started_at']).timestamp()
+        finished = parser.parse(result['finished_at']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        started = finished = None
+    if started is not None:
+        task_seconds.labels('queue').observe(max(started - watched, 0))
+        task_seconds.labels('compute').observe(max(finished - started, 0))
+        task_seconds.labels('poll').observe(max(detected - finished, 0))
+    task_seconds.labels('download').observe(downloaded - detected)
+
+
+# ------------------------------------------------------------------------------
+# Dash callbacks and metrics route
+# ------------------------------------------------------------------------------
+def register(app):
+    """ Time the Dash callbacks and serve the metrics on /metrics
+
+    Callbacks are labelled with their outputs, or 'unknown' for outputs
+    that are not a callback of the app, so clients cannot add labels.
+
+    With several worker processes, PROMETHEUS_MULTIPROC_DIR should point to
+    an empty directory shared by the workers, so the route reports the
+    metrics of all workers. Job processes hand their vantage6 calls over to
+    the worker that collects their output, see utils/jobs.py.
+    """
+    server = app.server
+
+    @server.before_request
+    def start_callback():
+        if request.path.endswith('/_dash-update-component'):
+            g.callback_start = time.perf_counter()
+
+    @server.after_request
+    def end_callback(response):
+        start = g.pop('callback_start', None)
+        if start is not None:
+            body = request.get_json(silent=True)
+            callback = body.get('output') if isinstance(body, dict) else None
+            if not isinstance(callback, str) or \
+                    callback not in app.callback_map:
+                callback = 'unknown'
+            callback_seconds.labels(callback).observe(
+                time.perf_counter() - start
+            )
+            if response.status_code >= 500:
+                callback_errors.labels(callback).inc()
+        return response
+
+    @server.route('/metrics')
+    def metrics():
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(
+            generate_latest(registry), mimetype=CONTENT_TYPE_LATEST
+        )
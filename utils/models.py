@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+Survival models fetched from vantage6 and their local store
+"""
+import json
+import time
+
+from utils.store import shared_store
+
+
+# ------------------------------------------------------------------------------
+# Linear model
+# ------------------------------------------------------------------------------
+class LinearModel:
+    """ Logistic regression evaluated with plain NumPy
+
+    Holds the coefficients of a fitted scikit-learn `LogisticRegression` and
+    scores patients with a dot product followed by a sigmoid, or a softmax
+    for multinomial models, without the input validation of scikit-learn.
+    Predictions match `predict` and `predict_proba` of the original model.
+    """
+
+    def __init__(self, classes, coef, intercept, multinomial=False):
+        import numpy as np
+
+        self.classes_ = np.asarray(classes)
+        self.coef = np.atleast_2d(np.asarray(coef, dtype=float))
+        self.intercept = np.atleast_1d(np.asarray(intercept, dtype=float))
+        self.multinomial = multinomial
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """ Extract the coefficients of a fitted `LogisticRegression`
+        """
+        multinomial = len(model.classes_) > 2 and (
+            model.multi_class == 'multinomial' or
+            model.multi_class == 'auto' and model.solver != 'liblinear'
+        )
+        return cls(
+            model.classes_, model.coef_, model.intercept_, multinomial
+        )
+
+    def decision_function(self, X):
+        import numpy as np
+
+        scores = np.asarray(X, dtype=float) @ self.coef.T + self.intercept
+        return scores[:, 0] if scores.shape[1] == 1 else scores
+
+    def predict_proba(self, X):
+        """ Probability of every class, one row per patient
+        """
+        import numpy as np
+
+        scores = self.decision_function(np.atleast_2d(X))
+        if scores.ndim == 1:
+            positive = _sigmoid(scores)
+            return np.column_stack([1. - positive, positive])
+        if self.multinomial:
+            scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        else:
+            scores = _sigmoid(scores)
+        return scores/scores.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        """ Most likely class of every patient
+        """
+        import numpy as np
+
+        scores = self.decision_function(np.atleast_2d(X))
+        if scores.ndim == 1:
+            return self.classes_[(scores > 0).astype(int)]
+        return self.classes_[np.argmax(scores, axis=1)]
+
+
+def _sigmoid(x):
+    import numpy as np
+
+    return .5*(1. + np.tanh(.5*x))
+
+
+# ------------------------------------------------------------------------------
+# Model store
+# ------------------------------------------------------------------------------
+class ModelStore:
+    """ Survival models keyed by the id of the task that trained them
+
+    Only the coefficients are kept, as raw arrays in the shared store, so a
+    model is loaded without unpickling the result it came with and survives
+    restarts of the dashboard.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        store.schema("""
+            CREATE TABLE IF NOT EXISTS models (
+                task_id INTEGER PRIMARY KEY, created REAL, classes TEXT,
+                features INTEGER, multinomial INTEGER, coef BLOB,
+                intercept BLOB, info TEXT
+            );
+        """)
+
+    def put(self, task_id, model, **info):
+        """ Store the model of a task, with some information to show with it
+        """
+        if not isinstance(model, LinearModel):
+            model = LinearModel.from_sklearn(model)
+        self.store.execute(
+            'INSERT OR REPLACE INTO models VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (task_id, time.time(), json.dumps(model.classes_.tolist()),
+             model.coef.shape[1], int(model.multinomial),
+             model.coef.tobytes(), model.intercept.tobytes(),
+             json.dumps(info, default=str))
+        )
+        return model
+
+    def get(self, task_id):
+        """ Model of a task and its information, or None
+        """
+        row = self.store.execute(
+            'SELECT * FROM models WHERE task_id = ?', (task_id,)
+        ).fetchone()
+        return self._load(row)
+
+    def latest(self):
+        """ Task id, model and information of the latest model, or None
+        """
+        row = self.store.execute(
+            'SELECT * FROM models ORDER BY created DESC LIMIT 1'
+        ).fetchone()
+        return (row[0], *self._load(row)) if row is not None else None
+
+    @staticmethod
+    def _load(row):
+        import numpy as np
+
+        if row is None:
+            return None
+        _, _, classes, features, multinomial, coef, intercept, info = row
+        model = LinearModel(
+            json.loads(classes),
+            np.frombuffer(coef).reshape(-1, features),
+            np.frombuffer(intercept),
+            bool(multinomial)
+        )
+        return model, json.loads(info)
+
+
+model_store = ModelStore(shared_store)
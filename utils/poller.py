@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+
+"""
+Background poller for vantage6 task results
+"""
+import os
+import time
+import logging
+import threading
+
+from utils import metrics
+from utils.client import client_manager
+from utils.decoding import decoder
+from utils.store import dumps
+from utils.store import loads
+from utils.store import shared_store
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------------------------------------------------
+# Task poller
+# ------------------------------------------------------------------------------
+class TaskPoller:
+    """ Single background thread that watches all outstanding tasks
+
+    Every watched task is checked with an adaptive backoff: the delay
+    between two checks starts at `min_delay` and grows by `backoff` after
+    every check that finds the task still running, up to `max_delay`.
+    Completed results are written to the shared store, so that callbacks of
+    any worker process can read them without contacting the server.
+
+    A task is watched by one worker process at a time: the worker holds a
+    lease on it, and another worker takes over once the lease runs out.
+
+    For a master task watched with `partial`, the status and results of its
+    subtasks are collected per organisation while it runs, see `progress`.
+
+    Results are kept for `ttl` seconds, as are tasks that nobody watched
+    for that long. Sending a task prunes the others at most every
+    `prune_interval` seconds.
+    """
+
+    min_delay = 2.
+    max_delay = 60.
+    backoff = 1.5
+    lease = 30.
+    ttl = 24*60*60.
+    prune_interval = 10*60.
+
+    def __init__(self, store):
+        self.store = store
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._names = {}
+        self._subtasks = {}
+        self._pruned = 0.
+        store.schema("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id INTEGER PRIMARY KEY, owner INTEGER, expires REAL
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                task_id INTEGER PRIMARY KEY, value BLOB, stored REAL
+            );
+            CREATE TABLE IF NOT EXISTS progress (
+                task_id INTEGER, organization INTEGER, name TEXT,
+                status TEXT, value BLOB,
+                PRIMARY KEY (task_id, organization)
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                result_id INTEGER PRIMARY KEY, task_id INTEGER
+            );
+        """)
+
+    def watch(self, task_id, partial=False):
+        """ Start watching a task, unless another worker already does
+
+        A task that is already watched is also followed per organisation
+        once it is watched again with `partial`.
+        """
+        now = time.time()
+        with self._lock:
+            prune = now - self._pruned >= self.prune_interval
+            if prune:
+                self._pruned = now
+        if prune:
+            self.prune()
+
+        claimed = self.store.execute(
+            'INSERT INTO tasks VALUES (?, ?, ?) ON CONFLICT (task_id) '
+            'DO UPDATE SET owner = excluded.owner, expires = excluded.expires '
+            'WHERE tasks.expires < ? OR tasks.owner = excluded.owner',
+            (task_id, os.getpid(), now + self.lease, now)
+        ).rowcount
+        if not claimed:
+            return
+
+        with self._lock:
+            info = self._tasks.setdefault(task_id, {
+                'due': now, 'delay': self.min_delay, 'watched': now,
+                'partial': partial
+            })
+            info['partial'] = info['partial'] or partial
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='vantage6-task-poller',
+                    daemon=True
+                )
+                self._thread.start()
+        self._wakeup.set()
+
+    def result(self, task_id, partial=False):
+        """ Return the result of a completed task, or None
+
+        A task that nobody watches anymore, for instance because its worker
+        was restarted or because it was sent by a job process, is picked up
+        by this worker, with `partial` as in `watch`. A task that completed
+        without a result that could be decoded has failed, see `failed`.
+        """
+        row = self.store.execute(
+            'SELECT value FROM results WHERE task_id = ?', (task_id,)
+        ).fetchone()
+        if row is not None:
+            return loads(row[0]) if row[0] is not None else None
+        with self._lock:
+            info = self._tasks.get(task_id)
+        if info is None or partial and not info['partial']:
+            self.watch(task_id, partial)
+        return None
+
+    def failed(self, task_id):
+        """ Whether a task completed without a result that could be decoded
+        """
+        row = self.store.execute(
+            'SELECT value FROM results WHERE task_id = ?', (task_id,)
+        ).fetchone()
+        return row is not None and row[0] is None
+
+    def progress(self, task_id):
+        """ Status of every organisation in a task watched with `partial`
+
+        Returns a list with the organisation, its name, its status (pending,
+        running, done, or failed when its result could not be decoded) and
+        its result once it is done.
+        """
+        rows = self.store.execute(
+            'SELECT organization, name, status, value FROM progress '
+            'WHERE task_id = ? ORDER BY organization', (task_id,)
+        ).fetchall()
+        return [
+            {
+                'organization': organization, 'name': name, 'status': status,
+                'result': loads(value) if value is not None else None
+            }
+            for organization, name, status, value in rows
+        ]
+
+    def forget(self, task_id):
+        """ Stop watching a task and drop its result
+        """
+        with self._lock:
+            self._tasks.pop(task_id, None)
+            self._subtasks.pop(task_id, None)
+        with self.store.transaction() as db:
+            db.execute('DELETE FROM tasks WHERE task_id = ?', (task_id,))
+            db.execute('DELETE FROM results WHERE task_id = ?', (task_id,))
+            db.execute('DELETE FROM progress WHERE task_id = ?', (task_id,))
+            db.execute('DELETE FROM runs WHERE task_id = ?', (task_id,))
+
+    def prune(self):
+        """ Drop the results and progress of the tasks older than `ttl`
+        """
+        expired = time.time() - self.ttl
+        with self.store.transaction() as db:
+            db.execute('DELETE FROM results WHERE stored < ?', (expired,))
+            db.execute('DELETE FROM tasks WHERE expires < ?', (expired,))
+            for table in ['progress', 'runs']:
+                db.execute(
+                    f'DELETE FROM {table} WHERE task_id NOT IN ('
+                    'SELECT task_id FROM tasks UNION '
+                    'SELECT task_id FROM results)'
+                )
+
+    def _run(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                due = [
+                    task_id for task_id, info in self._tasks.items()
+                    if info['due'] <= now
+                ]
+            for task_id in due:
+                self._check(task_id)
+            with self._lock:
+                if not self._tasks:
+                    self._thread = None
+                    return
+                wait = min(info['due'] for info in self._tasks.values())
+            self._wakeup.wait(max(wait - time.time(), 0))
+            self._wakeup.clear()
+
+    def _check(self, task_id):
+        with self._lock:
+            if task_id not in self._tasks:
+                return
+            watched = self._tasks[task_id]['watched']
+            partial = self._tasks[task_id]['partial']
+
+        progressed, running, complete, result = False, False, False, None
+        try:
+            client = client_manager.session()
+            if partial:
+                progressed, running = self._progress(client, task_id)
+            # The task cannot be complete while organisations still run it,
+            # otherwise the status alone tells whether it is, its results
+            # are only downloaded once it is
+            if not running and client.task.get(task_id).get('complete'):
+                detected = time.time()
+                results = decoder.list(client, task_id)
+                complete = True
+                if results:
+                    result = results[0]
+                    metrics.observe_task(
+                        watched, detected, time.time(), result
+                    )
+                    self.store.execute(
+                        "UPDATE progress SET status = 'done' "
+                        'WHERE task_id = ?', (task_id,)
+                    )
+                else:
+                    # Stored as failed, like the results of organisations
+                    # that cannot be decoded, and not downloaded again
+                    logger.error(
+                        f'No result of vantage6 task {task_id} could be '
+                        'decoded'
+                    )
+        except Exception:
+            logger.exception(f'Failed to check vantage6 task {task_id}')
+            complete, result = False, None
+
+        with self._lock:
+            if task_id not in self._tasks:
+                return
+            if complete:
+                del self._tasks[task_id]
+            else:
+                # Back off while nothing changes, check again soon after an
+                # organisation made progress
+                info = self._tasks[task_id]
+                info['delay'] = self.min_delay if progressed else \
+                    min(info['delay']*self.backoff, self.max_delay)
+                info['due'] = time.time() + info['delay']
+
+        if complete:
+            with self.store.transaction() as db:
+                db.execute(
+                    'INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                    (task_id, dumps(result) if result is not None else None,
+                     time.time())
+                )
+                db.execute('DELETE FROM tasks WHERE task_id = ?', (task_id,))
+        else:
+            self.store.execute(
+                'UPDATE tasks SET expires = ? WHERE task_id = ? AND owner = ?',
+                (info['due'] + self.lease, task_id, os.getpid())
+            )
+
+    def _progress(self, client, task_id):
+        # Status and results of the subtasks per organisation. The runs
+        # that are not finished are listed in one request per subtask, and
+        # results that are done are downloaded once and never requested
+        # again. Each is stored as soon as it is decoded, or as failed when
+        # it cannot be. A master task waits for its subtasks, so new ones
+        # are only looked for once the known ones are finished. Returns
+        # whether any organisation made progress, and whether any still
+        # runs.
+        known = dict(self.store.execute(
+            'SELECT organization, status FROM progress WHERE task_id = ?',
+            (task_id,)
+        ).fetchall())
+        fetched = {row[0] for row in self.store.execute(
+            'SELECT result_id FROM runs WHERE task_id = ?', (task_id,)
+        )}
+        runs, pending = [], []
+        subtasks = self._subtasks.pop(task_id, None) or client.task.list(
+            parent=task_id, include_metadata=False
+        )
+        for subtask in subtasks:
+            links = subtask.get('results')
+            if isinstance(links, list):
+                listed = decoder.rows(client, subtask['id'], state='open')
+                runs.extend(run for run in listed if run['id'] not in fetched)
+                listed = {run['id'] for run in listed}
+                pending.extend(
+                    link['id'] for link in links
+                    if link['id'] not in fetched and link['id'] not in listed
+                )
+            else:
+                runs.extend(
+                    run for run in decoder.rows(client, subtask['id'])
+                    if run['id'] not in fetched
+                )
+        runs.extend(decoder.fetch(client, pending))
+
+        changed = []
+        for run in runs:
+            if run.get('finished_at'):
+                status = 'done'
+            elif run.get('started_at'):
+                status = 'running'
+            else:
+                status = 'pending'
+            if known.get(run['organization']['id']) != status:
+                changed.append({**run, 'status': status})
+
+        running = [run for run in changed if run['status'] != 'done']
+        done = [run for run in changed if run['status'] == 'done']
+        for run in running:
+            self._store_progress(client, task_id, run, None)
+        decoded = set()
+        for _, run in decoder.decode(client, done):
+            self._store_progress(client, task_id, run, run.get('result'))
+            self.store.execute(
+                'INSERT OR REPLACE INTO runs VALUES (?, ?)',
+                (run['id'], task_id)
+            )
+            decoded.add(run['id'])
+        for run in done:
+            if run['id'] not in decoded:
+                self._store_progress(
+                    client, task_id, {**run, 'status': 'failed'}, None
+                )
+                self.store.execute(
+                    'INSERT OR REPLACE INTO runs VALUES (?, ?)',
+                    (run['id'], task_id)
+                )
+        unfinished = any(not run.get('finished_at') for run in runs)
+        if unfinished:
+            self._subtasks[task_id] = subtasks
+        return len(running) + len(decoded) > 0, unfinished
+
+    def _store_progress(self, client, task_id, run, result):
+        organization = run['organization']['id']
+        self.store.execute(
+            'INSERT OR REPLACE INTO progress VALUES (?, ?, ?, ?, ?)',
+            (task_id, organization, self._name(client, organization),
+             run['status'], dumps(result) if result is not None else None)
+        )
+
+    def _name(self, client, organization):
+        # The names of the organisations are listed in one request, those
+        # not on its page are requested one by one
+        if organization not in self._names:
+            try:
+                for listed in client.organization.list(
+                    include_metadata=False
+                ):
+                    self._names.setdefault(listed['id'], listed['name'])
+                if organization not in self._names:
+                    self._names[organization] = \
+                        client.organization.get(organization)['name']
+            except Exception:
+                return f'organization {organization}'
+        return self._names[organization]
+
+
+poller = TaskPoller(shared_store)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache of the outputs rendered from federated results
+"""
+import json
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from pages import config
+from utils import metrics
+
+
+# ------------------------------------------------------------------------------
+# Render cache
+# ------------------------------------------------------------------------------
+class RenderCache:
+    """ LRU of the figures and lookups rendered from a result
+
+    Outputs are keyed by a hash of the result they were rendered from, so
+    a page that is visited again, by any user of the worker, shows them
+    without parsing the result and building the figures again.
+    """
+
+    def __init__(self, max_items=64):
+        self.max_items = max_items
+        self._outputs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind, task_id, finished_at):
+        """ Hash of an output and the result it is rendered from
+        """
+        content = json.dumps([kind, task_id, finished_at], default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key, render):
+        """ Return the output of a key, rendered by `render` when missing
+        """
+        with self._lock:
+            if key in self._outputs:
+                self._outputs.move_to_end(key)
+                metrics.render_cache.labels('hit').inc()
+                return self._outputs[key]
+        metrics.render_cache.labels('miss').inc()
+        output = render()
+        with self._lock:
+            self._outputs[key] = output
+            while len(self._outputs) > self.max_items:
+                self._outputs.popitem(last=False)
+        return output
+
+
+render_cache = RenderCache(getattr(config, 'render_cache_size', 64))
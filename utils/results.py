@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parsers for federated results
+"""
+from utils import cdm
+
+
+# ------------------------------------------------------------------------------
+# Statistics
+# ------------------------------------------------------------------------------
+def parse_statistics(results, cutoff, delta):
+    """ Turn the statistics results into the four tables of the page
+
+    The results are walked once, appending every organisation to column
+    lists, and each table is built from its columns in one go at the end.
+    Stages and vital statuses are ordered as in the CDM.
+
+    Returns the patients per centre, patients per centre per stage,
+    patients per centre per vital status and survival rate per centre.
+    """
+    import numpy as np
+    import pandas as pd
+
+    days = np.arange(0, cutoff, delta)
+    patients = {'patients': [], 'centre': []}
+    stage = {'centre': []}
+    vital_status = {'centre': []}
+    curves = []
+    curve_centres = []
+
+    for result in results:
+        centre = result['organisation']
+        if 'nids' in result:
+            patients['patients'].append(result['nids'])
+            patients['centre'].append(centre)
+        if 'stage' in result:
+            _extend(stage, result['stage'], centre)
+        if 'vital_status' in result:
+            _extend(vital_status, result['vital_status'], centre)
+        if 'survival' in result:
+            curves.append(np.asarray(result['survival'], dtype=float))
+            curve_centres.append(centre)
+
+    dfg1 = pd.DataFrame(patients)
+    dfg2 = _cdm_order(pd.DataFrame(stage), 'stage').rename(
+        columns={'id': 'patients'}
+    )
+    dfg3 = _cdm_order(pd.DataFrame(vital_status), 'vital_status').rename(
+        columns={'id': 'patients', 'vital_status': 'vital status'}
+    )
+
+    lengths = [len(curve) for curve in curves]
+    dfg4 = pd.DataFrame({
+        'survival rate': np.concatenate(curves) if curves else [],
+        'survival days': np.concatenate(
+            [days[:length] for length in lengths]
+        ) if curves else [],
+        'centre': np.repeat(curve_centres, lengths)
+    })
+
+    return dfg1, dfg2, dfg3, dfg4
+
+
+def pool_survival(results, cutoff, delta, z=1.96):
+    """ Patient-weighted survival curve of all centres with its band
+
+    Every centre's curve is aligned onto the shared grid of days from 0 to
+    `cutoff` by `delta`, holding its last value until the next time point
+    (a step function, like a Kaplan-Meier curve). A centre may send the
+    days of its curve in `survival_days`; otherwise its curve follows the
+    shared grid, the days being in increasing order. A centre holds the
+    last value of its curve past its end, so that it keeps its weight at
+    every later time point and the pooled curve never rises where a
+    shorter curve stops. Every centre is weighted by its number of patients
+    `nids`.
+
+    The band is the pooled curve plus or minus `z` standard errors, with
+    the binomial variance S(1 - S)/n of every centre.
+
+    Returns a DataFrame with the survival days, the pooled survival rate,
+    the lower and upper bounds of the band and the number of patients.
+    """
+    import numpy as np
+    import pandas as pd
+
+    grid = np.arange(0, cutoff, delta, dtype=float)
+    curves, days, weights = [], [], []
+    for result in results:
+        if 'survival' not in result:
+            continue
+        curve = np.asarray(result['survival'], dtype=float)
+        x = result.get('survival_days')
+        x = grid[:len(curve)] if x is None else np.asarray(x, dtype=float)
+        n = min(len(curve), len(x))
+        if n:
+            curves.append(curve[:n])
+            days.append(x[:n])
+            weights.append(float(result.get('nids') or 0))
+    if not curves or not len(grid):
+        return pd.DataFrame({
+            'survival days': [], 'survival rate': [], 'lower': [],
+            'upper': [], 'patients': []
+        })
+
+    # Step lookup of all centres at all time points in a single search: the
+    # days of every centre are shifted by a multiple of a span larger than
+    # any of them, so that the concatenated days stay sorted
+    lengths = np.array([len(curve) for curve in curves])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    x = np.concatenate(days)
+    low = min(x.min(), grid[0])
+    span = max(x.max(), grid[-1]) - low + 1.
+    centre = np.repeat(np.arange(len(curves)), lengths)
+    keys = x - low + centre*span
+    queries = (grid - low) + np.arange(len(curves))[:, np.newaxis]*span
+    index = np.searchsorted(keys, queries, side='right') - 1 - \
+        starts[:, np.newaxis]
+    valid = index >= 0
+    rows = (index + starts[:, np.newaxis]).clip(0, len(x) - 1)
+    S = np.where(valid, np.concatenate(curves)[rows], 0.).clip(0, 1)
+
+    # Weighted mean and its standard error over the centres at every time
+    w = np.asarray(weights)[:, np.newaxis]*valid
+    total = w.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pooled = (w*S).sum(axis=0)/total
+        error = np.sqrt((w*S*(1. - S)).sum(axis=0))/total
+    return pd.DataFrame({
+        'survival days': grid,
+        'survival rate': pooled,
+        'lower': (pooled - z*error).clip(0, 1),
+        'upper': (pooled + z*error).clip(0, 1),
+        'patients': total
+    }).dropna()
+
+
+def _cdm_order(df, name):
+    import numpy as np
+
+    if name not in df.columns:
+        return df
+    order = np.argsort(cdm.encode(name, df[name]), kind='stable')
+    return df.iloc[order].reset_index(drop=True)
+
+
+def _extend(columns, table, centre):
+    # Tables come as a mapping of columns, each column being either a list
+    # or an {index: value} mapping as produced by DataFrame.to_dict
+    rows = len(columns['centre'])
+    table = {
+        name: list(values.values()) if isinstance(values, dict)
+        else list(values)
+        for name, values in table.items()
+    }
+    n = max((len(values) for values in table.values()), default=0)
+    for name, values in table.items():
+        column = columns.setdefault(name, [None]*rows)
+        column.extend(values)
+    for name, column in columns.items():
+        if name != 'centre' and name not in table:
+            column.extend([None]*n)
+    columns['centre'].extend([centre]*n)
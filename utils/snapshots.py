@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""
+Snapshots of completed federated results
+"""
+import os
+import time
+import pickle
+import logging
+import threading
+
+from pages import config
+from utils import cdm
+
+
+logger = logging.getLogger(__name__)
+
+# Version of the snapshot files, bumped when their content changes
+FORMAT = 1
+
+
+# ------------------------------------------------------------------------------
+# Snapshots
+# ------------------------------------------------------------------------------
+class SnapshotStore:
+    """ Completed results of every analysis, saved as files in a directory
+
+    A snapshot holds the result of a task as the pages use it, so in
+    offline mode the pages render it without any call to vantage6. Files
+    are only read when a page first needs them, and kept in memory until
+    they change on disk.
+
+    Snapshots are pickled, and loading a pickle can run arbitrary code, so
+    only snapshots captured with snapshot.py by a trusted party should be
+    placed in the directory.
+    """
+
+    def __init__(self, path, offline=False):
+        self.path = path
+        self.offline = offline
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def save(self, analysis, result_info):
+        """ Write the result of an analysis as its snapshot
+        """
+        os.makedirs(self.path, exist_ok=True)
+        snapshot = {
+            'format': FORMAT, 'analysis': analysis, 'captured': time.time(),
+            'result': result_info
+        }
+        tmp = f'{self._file(analysis)}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._file(analysis))
+
+    def load(self, analysis):
+        """ Result in the snapshot of an analysis, or None
+        """
+        try:
+            modified = os.stat(self._file(analysis)).st_mtime
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            loaded = self._loaded.get(analysis)
+        if loaded is not None and loaded[0] == modified:
+            return loaded[1]
+
+        try:
+            with open(self._file(analysis), 'rb') as f:
+                snapshot = pickle.load(f)
+        except Exception:
+            logger.exception(f'Could not read the snapshot of {analysis}')
+            return None
+        if snapshot.get('format') != FORMAT:
+            logger.error(
+                f'Snapshot of {analysis} has format {snapshot.get("format")}'
+                f', expected {FORMAT}'
+            )
+            return None
+        with self._lock:
+            self._loaded[analysis] = (modified, snapshot['result'])
+        return snapshot['result']
+
+    def _file(self, analysis):
+        return os.path.join(self.path, f'{analysis}.pkl')
+
+
+snapshots = SnapshotStore(
+    getattr(config, 'snapshot_dir', None) or
+    os.path.join(cdm.input_path, 'snapshots'),
+    offline=getattr(config, 'offline', False)
+)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-session task state
+"""
+import time
+import threading
+
+from collections.abc import MutableMapping
+
+from utils.store import dumps
+from utils.store import loads
+from utils.store import shared_store
+
+
+# ------------------------------------------------------------------------------
+# Session store
+# ------------------------------------------------------------------------------
+class SessionStore:
+    """ Session-keyed state with LRU eviction and a time to live
+
+    Each browser session gets its own state, split per page namespace, so
+    concurrent users do not overwrite each other's tasks and results. The
+    state lives in the shared store, so every worker process sees the same
+    state. At most `max_sessions` sessions are kept: the least recently used
+    one is evicted first, and sessions idle for longer than `ttl` seconds
+    expire.
+
+    Getting a state is a read: a worker records the use of a session at
+    most every `touch_interval` seconds, and evicts sessions at most every
+    `evict_interval` seconds.
+    """
+
+    touch_interval = 60.
+    evict_interval = 60.
+
+    def __init__(self, store, max_sessions=256, ttl=12*60*60):
+        self.store = store
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._touched = {}
+        self._evicted = time.time()
+        self._lock = threading.Lock()
+        store.schema("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session TEXT PRIMARY KEY, touched REAL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_touched
+                ON sessions (touched);
+            CREATE TABLE IF NOT EXISTS state (
+                session TEXT, namespace TEXT, key TEXT, value BLOB,
+                PRIMARY KEY (session, namespace, key)
+            );
+        """)
+
+    def get(self, session_id, namespace):
+        """ Return the state of a page for a session
+        """
+        now = time.time()
+        with self._lock:
+            touch = now - self._touched.get(session_id, 0.) \
+                >= self.touch_interval
+            if touch:
+                self._touched[session_id] = now
+            evict = now - self._evicted >= self.evict_interval
+            if evict:
+                self._evicted = now
+        if touch:
+            self.store.execute(
+                'INSERT INTO sessions VALUES (?, ?) ON CONFLICT (session) '
+                'DO UPDATE SET touched = excluded.touched', (session_id, now)
+            )
+        if evict:
+            self.evict()
+        return SessionState(self.store, session_id, namespace)
+
+    def evict(self):
+        """ Remove the expired and least recently used sessions
+        """
+        # Sessions of this worker are touched again on their next use, in
+        # case they were evicted
+        now = time.time()
+        with self._lock:
+            self._touched.clear()
+        with self.store.transaction() as db:
+            db.execute(
+                'DELETE FROM sessions WHERE touched < ? OR session IN ('
+                'SELECT session FROM sessions ORDER BY touched DESC '
+                'LIMIT -1 OFFSET ?)', (now - self.ttl, self.max_sessions)
+            )
+            db.execute(
+                'DELETE FROM state WHERE session NOT IN ('
+                'SELECT session FROM sessions)'
+            )
+
+    def drop(self, session_id):
+        """ Remove all state of a session
+        """
+        with self._lock:
+            self._touched.pop(session_id, None)
+        with self.store.transaction() as db:
+            db.execute('DELETE FROM sessions WHERE session = ?', (session_id,))
+            db.execute('DELETE FROM state WHERE session = ?', (session_id,))
+
+    def __len__(self):
+        return self.store.execute(
+            'SELECT COUNT(*) FROM sessions'
+        ).fetchone()[0]
+
+
+# ------------------------------------------------------------------------------
+# Session state
+# ------------------------------------------------------------------------------
+class SessionState(MutableMapping):
+    """ Write-through mapping with the state of a page for a session
+
+    Values are read from and written to the shared store on every access,
+    so changes to a value read from the state must be assigned back.
+    """
+
+    def __init__(self, store, session_id, namespace):
+        self.store = store
+        self.where = (session_id, namespace)
+
+    def __getitem__(self, key):
+        row = self.store.execute(
+            'SELECT value FROM state '
+            'WHERE session = ? AND namespace = ? AND key = ?',
+            (*self.where, key)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return loads(row[0])
+
+    def __setitem__(self, key, value):
+        self.store.execute(
+            'INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)',
+            (*self.where, key, dumps(value))
+        )
+
+    def __delitem__(self, key):
+        cursor = self.store.execute(
+            'DELETE FROM state WHERE session = ? AND namespace = ? AND key = ?',
+            (*self.where, key)
+        )
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.store.execute(
+            'SELECT 1 FROM state '
+            'WHERE session = ? AND namespace = ? AND key = ?',
+            (*self.where, key)
+        ).fetchone() is not None
+
+    def __iter__(self):
+        rows = self.store.execute(
+            'SELECT key FROM state WHERE session = ? AND namespace = ?',
+            self.where
+        ).fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self):
+        return self.store.execute(
+            'SELECT COUNT(*) FROM state WHERE session = ? AND namespace = ?',
+            self.where
+        ).fetchone()[0]
+
+
+sessions = SessionStore(shared_store)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local store shared by all worker processes
+"""
+import os
+import pickle
+import sqlite3
+import threading
+
+from pages import config
+
+
+# ------------------------------------------------------------------------------
+# Shared store
+# ------------------------------------------------------------------------------
+class SharedStore:
+    """ SQLite database that every worker process of the dashboard can read
+
+    Every thread gets its own connection, which is re-opened after a fork.
+    The database runs in WAL mode, so readers do not block the writer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._schemas = []
+
+    def schema(self, script):
+        """ Register tables, created on every new connection if missing
+        """
+        self._schemas.append(script)
+        if getattr(self._local, 'connection', None) is not None:
+            self._local.connection.executescript(script)
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for script in self._schemas:
+                connection.executescript(script)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def execute(self, sql, parameters=()):
+        return self.connection().execute(sql, parameters)
+
+    def transaction(self):
+        """ Context manager running statements in one write transaction
+        """
+        return _Transaction(self.connection())
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+def dumps(value):
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads(value):
+    return pickle.loads(value)
+
+
+shared_store = SharedStore(getattr(
+    config, 'state_db',
+    os.path.join(
+        getattr(config, 'cache_dir', os.path.join(os.getcwd(), 'cache')),
+        'state.sqlite'
+    )
+))
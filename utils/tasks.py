@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+"""
+Federated tasks of the analyses
+"""
+import time
+import logging
+
+from dash import html
+from dateutil import parser
+
+from pages import config
+from utils.cache import result_cache
+from utils.client import client_manager
+from utils.history import history
+from utils.poller import poller
+from utils.snapshots import snapshots
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------------------------------------------------
+# Analysis
+# ------------------------------------------------------------------------------
+class Analysis:
+    """ vantage6 task of a page and its result
+
+    The task runs `image`, the name of the image setting in config.py, with
+    the master method and the keyword arguments returned by `kwargs`. Its
+    result is cached by input, so the same task is not sent again while its
+    result is fresh, and each result is recorded in the history with the
+    records returned by `records`. In offline mode the result is the
+    snapshot of the analysis.
+
+    With `partial`, the results of the organisations are collected while the
+    task runs, see `TaskPoller.progress`.
+    """
+
+    def __init__(self, name, image, task_name, description, kwargs,
+                 records, partial=False):
+        self.name = name
+        self.image = image
+        self.task_name = task_name
+        self.description = description
+        self.kwargs = kwargs
+        self.records = records
+        self.partial = partial
+
+    def task_input(self):
+        """ Input of the task and the key of its cached result
+        """
+        input_ = {
+            'method': 'master',
+            'master': True,
+            'kwargs': self.kwargs()
+        }
+        return input_, result_cache.key(
+            getattr(config, self.image), config.collaboration, config.org_ids,
+            input_['kwargs']
+        )
+
+    def cached_result(self, key=None):
+        """ Result of the last task, or None
+
+        The result comes from the result cache, or from the snapshot of the
+        analysis in offline mode.
+        """
+        if snapshots.offline:
+            return snapshots.load(self.name)
+        return result_cache.get(key or self.task_input()[1])
+
+    def dispatch(self, state, progress=None, watch=True, force=False):
+        """ Send the task, unless its results are cached
+
+        Returns whether the results were 'cached', or the task was 'created'
+        or 'failed', and the seconds saved by reusing the vantage6 session.
+        Steps are reported to `progress`. A job process does not `watch` the
+        task, the worker that polls its results does. With `force`, the
+        cached result is dropped and the task is sent again.
+        """
+        # Return the cached result when the same task already ran recently,
+        # or the snapshot of the analysis in offline mode
+        input_, state['key'] = self.task_input()
+        state.pop('result', None)
+        state.pop('failed', None)
+        if force and not snapshots.offline:
+            result_cache.invalidate(state['key'])
+        cached = self.cached_result(state['key'])
+        if cached:
+            state['task'] = state['start'] = None
+            state['result'] = cached
+            return 'cached', 0.
+        if snapshots.offline:
+            return 'failed', 0.
+
+        # Get the shared vantage6 client, authentication happens only once
+        if progress:
+            progress('Connecting to vantage6...')
+        client, saved = client_manager.get()
+        if progress:
+            progress('Creating the task...')
+
+        state['start'] = time.time()
+        task = state['task'] = client.task.create(
+            collaboration=config.collaboration,
+            organizations=config.org_ids,
+            name=self.task_name,
+            image=getattr(config, self.image),
+            description=self.description,
+            input=input_,
+            data_format='json'
+        )
+
+        if task:
+            if watch:
+                poller.watch(task['id'], partial=self.partial)
+            return 'created', saved
+        return 'failed', saved
+
+    def send(self, state, n_clicks, set_progress, force=False):
+        """ Output of the send button of the page, from its long callback
+
+        The long callback runs in a job process, so the request threads stay
+        free while the server is slow to authenticate or to create the task.
+        With `force`, the task is sent even if its results are cached.
+        """
+        if n_clicks > 0:
+            try:
+                status, saved = self.dispatch(
+                    state, lambda step: set_progress(html.Plaintext(step)),
+                    watch=False, force=force
+                )
+            except Exception:
+                # A job that raises never returns an output, the page would
+                # keep waiting for it, so the failure is the output instead.
+                # The results of a previous task are not shown anymore.
+                logger.exception(f'Could not send the {self.name} task')
+                state['task'] = state['result'] = None
+                status, saved = 'failed', 0.
+
+            # Output for UI
+            if status == 'cached':
+                return html.Plaintext('Found cached results, no task was sent')
+            elif status == 'created':
+                return html.Div([
+                    html.Plaintext('Task was created, waiting for results...'),
+                    html.Plaintext(
+                        f'Reused vantage6 session, saved {round(saved, 3)} '
+                        'seconds'
+                    ) if saved else html.P(),
+                ])
+            else:
+                return html.Div(
+                    html.Plaintext('Something went wrong...')
+                )
+        else:
+            return html.Plaintext('')
+
+    def result(self, state):
+        """ Result of the task of a session, or None while it runs
+
+        Results are fetched in the background by the task poller, and kept in
+        the result cache and the history once they are available. Offline,
+        the snapshot is shown without sending any task.
+        """
+        if snapshots.offline and not state.get('result'):
+            self.dispatch(state)
+        result_info = state.get('result')
+        task = state.get('task')
+        if result_info is None and task:
+            result_info = poller.result(task['id'], partial=self.partial)
+            if result_info:
+                state['result'] = result_info
+                result_cache.set(state['key'], result_info)
+                history.record(
+                    task['id'], self.name, result_info['finished_at'],
+                    self.records(result_info)
+                )
+            elif poller.failed(task['id']):
+                # The page stops waiting for the task
+                state['task'] = None
+                state['failed'] = True
+        return result_info
+
+    def failure(self, state):
+        """ Message of a task that completed without a result, or ''
+        """
+        if state.get('failed'):
+            return 'The task completed, but its result could not be read'
+        return ''
+
+    def status(self, state, result_info, minutes=False):
+        """ Duration of the task of a session, or where its result is from
+        """
+        if state['start']:
+            end = parser.parse(result_info['finished_at']).timestamp()
+            if minutes:
+                duration = round((end - state['start'])/60., 3)
+                return f'Analysis completed in {duration} minutes'
+            duration = round((end - state['start']), 3)
+            return f'Analysis completed in {duration} seconds'
+        source = 'Snapshot' if snapshots.offline else 'Cached results'
+        return f'{source} of the analysis finished at ' \
+               f'{result_info["finished_at"]}'
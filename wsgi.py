@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""
+WSGI entry point of the dashboard for production servers
+
+Run with: gunicorn -c gunicorn.conf.py wsgi:application
+"""
+import time
+import logging
+import importlib
+
+from index import app
+from utils import cdm
+from utils.snapshots import snapshots
+
+
+logger = logging.getLogger(__name__)
+
+application = app.server
+
+# Dependencies imported lazily by the callbacks
+WARMUP_MODULES = [
+    'numpy', 'pandas', 'plotly.express', 'plotly.graph_objects',
+    'plotly.subplots', 'vantage6.client', 'jwt'
+]
+
+
+# ------------------------------------------------------------------------------
+# Warm up
+# ------------------------------------------------------------------------------
+def warmup():
+    """ Prepare a worker before it accepts traffic
+
+    Imports the dependencies of the callbacks, builds the TNM grid and
+    renders the layout once, so the first user of a worker does not pay
+    for it. In offline mode the snapshots are read as well.
+    """
+    start = time.time()
+    for module in WARMUP_MODULES:
+        importlib.import_module(module)
+    cdm.grid()
+    if snapshots.offline:
+        for analysis in ['statistics', 'similarity', 'survival']:
+            snapshots.load(analysis)
+    with application.test_client() as client:
+        for path in ['/', '/_dash-layout', '/_dash-dependencies']:
+            client.get(path)
+    logger.info(f'Worker warmed up in {time.time() - start:.3f} seconds')